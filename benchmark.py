@@ -0,0 +1,723 @@
+"""benchmarks for catbus
+
+    python3 benchmark.py            # run everything
+    python3 benchmark.py rson_parse # run one benchmark
+
+"""
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+
+from datetime import datetime, timezone
+
+from catbus import client, dom, rson, server
+
+benchmarks = {}
+
+def benchmark(fn):
+    benchmarks[fn.__name__] = fn
+    return fn
+
+def timeit(fn, min_seconds=0.5):
+    """ returns the best time per call, in seconds """
+    best = None
+    total, runs = 0.0, 0
+    while total < min_seconds or runs < 3:
+        start = time.perf_counter()
+        fn()
+        t = time.perf_counter() - start
+        total += t
+        runs += 1
+        if best is None or t < best:
+            best = t
+    return best
+
+def report(name, before, after):
+    print("  {:<32} {:>10.3f}ms {:>10.3f}ms {:>7.2f}x".format(
+        name, before * 1000, after * 1000, before / after))
+
+def report_header(before, after):
+    print("  {:<32} {:>12} {:>12} {:>8}".format('', before, after, 'speedup'))
+
+def spec_vectors(section):
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'spec', 'rson.md')
+    with open(path) as fh:
+        spec = fh.read()
+    block = re.search(r"## {}\n```\n(.*?)```".format(section), spec, re.S).group(1)
+    return [line for line in block.split('\n') if line.strip()]
+
+def make_cursor(n):
+    now = datetime.now(timezone.utc)
+    items = []
+    for i in range(n):
+        items.append(dom.Resource(
+            kind = 'Job',
+            metadata = dict(
+                id = 'job-{}'.format(i),
+                collection = '/Job',
+                url = '/Job/id/job-{}'.format(i),
+                links = ['status'],
+                actions = {'stop': [], 'start': [], 'resize': ['size']},
+            ),
+            attributes = dict(
+                name = 'job-{}'.format(i),
+                state = 'run' if i % 3 else 'stop',
+                size = i * 3,
+                load = i / 7,
+                created = now,
+                tags = ['batch', 'nightly'],
+            ),
+        ))
+    return dom.Cursor(
+        kind = 'Job',
+        metadata = {'collection': '/Job/list', 'selector': None, 'continue': None},
+        items = items,
+    )
+
+@benchmark
+def rson_parse():
+    codec = dom.registry.codec
+
+    def recursive(buf):
+        return codec.parse_recursive(buf, 0)[0]
+
+    def iterative(buf):
+        return codec.parse_rson(buf, 0)[0]
+
+    print("rson parse: parse_recursive vs parse_rson")
+    report_header('recursive', 'iterative')
+
+    vectors = spec_vectors('MUST parse')
+    def run(parse):
+        def _run():
+            for _ in range(1000):
+                for buf in vectors:
+                    parse(buf)
+        return _run
+    report('spec vectors x1000', timeit(run(recursive)), timeit(run(iterative)))
+
+    for n in (1000, 10000, 50000):
+        buf = dom.dump(make_cursor(n))
+        name = 'cursor {} items ({:.1f}MB)'.format(n, len(buf) / 1e6)
+        report(name, timeit(lambda: recursive(buf)), timeit(lambda: iterative(buf)))
+
+    depth = 100000
+    buf = '[' * depth + ']' * depth
+    try:
+        recursive(buf)
+    except RecursionError:
+        before = 'RecursionError'
+    else:
+        before = 'ok'
+    iterative(buf)
+    print("  {:<32} {:>12} {:>12}".format('nested {} deep'.format(depth), before, 'ok'))
+
+@benchmark
+def rson_dump_iter():
+    print("rson dump: dump vs dump_iter, first byte and peak memory")
+    print("  {:<24} {:>14} {:>14} {:>12} {:>12}".format(
+        '', 'dump first', 'iter first', 'dump peak', 'iter peak'))
+
+    for n in (1000, 10000, 50000):
+        cursor = make_cursor(n)
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        dom.dump(cursor)
+        dump_first = time.perf_counter() - start
+        dump_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        iter_first = None
+        for chunk in dom.dump_iter(cursor):
+            if iter_first is None:
+                iter_first = time.perf_counter() - start
+        iter_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        print("  {:<24} {:>12.3f}ms {:>12.3f}ms {:>10.1f}MB {:>10.1f}MB".format(
+            'cursor {} items'.format(n), dump_first * 1000, iter_first * 1000,
+            dump_peak / 1e6, iter_peak / 1e6))
+
+def make_namespace(depth, width):
+    embeds = {}
+    if depth:
+        for i in range(width):
+            embeds['Child{}'.format(i)] = make_namespace(depth - 1, width)
+    return dom.Namespace(
+        kind = 'Service',
+        metadata = dict(
+            url = '/Service{}'.format(depth),
+            links = ['status', 'info'] + list(embeds),
+            actions = {'method{}'.format(i): ['a', 'b'] for i in range(10)},
+            embeds = embeds,
+        ),
+        attributes = {'name': 'service', 'count': depth, 'ready': True},
+    )
+
+class ChainCodec(rson.Codec):
+    """dump_rson as a chain of isinstance tests, before encoders"""
+    def dump_rson(self, obj, buf, transform=None):
+        if transform:
+            obj = transform(obj)
+        if obj is True or obj is False or obj is None:
+            buf.write(rson.builtin_values[obj])
+        elif isinstance(obj, str):
+            self.dump_str(obj, buf)
+        elif isinstance(obj, int):
+            buf.write(str(obj))
+        elif isinstance(obj, float):
+            self.dump_float(obj, buf)
+        elif isinstance(obj, complex):
+            self.dump_complex(obj, buf)
+        elif isinstance(obj, (bytes, bytearray)):
+            self.dump_bytes(obj, buf)
+        elif isinstance(obj, (list, tuple)):
+            self.dump_list(obj, buf, transform)
+        elif isinstance(obj, set):
+            self.dump_set(obj, buf, transform)
+        elif isinstance(obj, rson.OrderedDict):
+            self.dump_record(obj, buf, transform)
+        elif isinstance(obj, dict):
+            self.dump_dict(obj, buf, transform)
+        elif isinstance(obj, datetime):
+            self.dump_datetime(obj, buf)
+        elif isinstance(obj, rson.timedelta):
+            self.dump_timedelta(obj, buf)
+        else:
+            self.dump_tagged(obj, buf, transform)
+
+@benchmark
+def rson_dump():
+    registry = dom.registry
+    chain = ChainCodec(registry.as_tagged, registry.from_tagged)
+    codec = rson.Codec(registry.as_tagged, registry.from_tagged)
+    for cls, name in registry.tag_for.items():
+        codec.add_tag(cls, name)
+
+    print("rson dump: isinstance chain vs encoder table")
+    report_header('chain', 'table')
+
+    tests = [
+        ('cursor 1000 resources', make_cursor(1000)),
+        ('cursor 10000 resources', make_cursor(10000)),
+        ('namespace tree 4x5', make_namespace(4, 5)),
+    ]
+    for name, obj in tests:
+        if chain.dump(obj) != codec.dump(obj):
+            raise AssertionError(name)
+        report(name, timeit(lambda: chain.dump(obj)), timeit(lambda: codec.dump(obj)))
+
+@benchmark
+def rson_binary():
+    text, binary = dom.registry.codec, dom.registry.binary
+
+    print("rson wire formats: text vs binary")
+    report_header('text', 'binary')
+
+    for n in (1000, 10000):
+        cursor = make_cursor(n)
+        name = 'cursor {} items'.format(n)
+        report(name + ' dump', timeit(lambda: text.dump(cursor)), timeit(lambda: binary.dump(cursor)))
+        buf, data = text.dump(cursor).encode('utf-8'), binary.dump(cursor)
+        report(name + ' parse', timeit(lambda: text.parse_bytes(buf)), timeit(lambda: binary.parse_bytes(data)))
+        print("  {:<32} {:>10.1f}kB {:>10.1f}kB".format(name + ' size', len(buf) / 1e3, len(data) / 1e3))
+
+def make_job_server(n, compress_min_size):
+    jobs = {}
+    registry = server.Registry(name="bench")
+
+    @registry.add()
+    class Job:
+        Handler = server.Collection.dict_handler('name', jobs)
+
+        def __init__(self, name):
+            self.name = name
+            self.state = 'run'
+            self.size = len(name)
+
+        @server.rpc()
+        def stop(self):
+            self.state = 'stop'
+
+    for i in range(n):
+        jobs['job-{}'.format(i)] = Job('job-{}'.format(i))
+
+    return server.Server(registry.app(compress_min_size), port=0)
+
+@benchmark
+def http_compression():
+    print("list pages over http: identity vs compressed responses")
+    print("  {:<16} {:>12} {:>12} {:>8} {:>12} {:>12} {:>8}".format(
+        '', 'plain size', 'gzip size', 'ratio', 'plain time', 'gzip time', 'speedup'))
+
+    for n in (1000, 10000, 100000):
+        sizes, times = [], []
+        for compress_min_size in (None, server.COMPRESS_MIN_SIZE):
+            server_thread = make_job_server(n, compress_min_size)
+            server_thread.start()
+            try:
+                c = client.Client()
+                url = server_thread.url + "bench/Job/list"
+                raw = c.session.get(url, stream=True)
+                sizes.append(len(raw.raw.read(decode_content=False)))
+                raw.close()
+
+                request = dom.Request('GET', url, {}, {}, None)
+                def fetch():
+                    for item in c.List(request):
+                        pass
+                times.append(timeit(fetch, min_seconds=0.1 if n < 100000 else 0))
+            finally:
+                server_thread.stop()
+
+        print("  {:<16} {:>10.1f}kB {:>10.1f}kB {:>7.1f}x {:>10.1f}ms {:>10.1f}ms {:>7.2f}x".format(
+            '{} items'.format(n), sizes[0] / 1e3, sizes[1] / 1e3, sizes[0] / sizes[1],
+            times[0] * 1000, times[1] * 1000, times[0] / times[1]))
+
+def load_test(url, clients, requests_per_client):
+    """ returns (requests/second, sorted latencies in seconds, failures) """
+    latencies, failures = [], []
+    def run():
+        c = client.Client()
+        request = dom.Request('POST', url, {}, {}, {'n': 1})
+        out = []
+        for _ in range(requests_per_client):
+            start = time.perf_counter()
+            try:
+                c.fetch(request)
+            except IOError:
+                failures.append(1) # reset while waiting to be accepted
+                continue
+            out.append(time.perf_counter() - start)
+        latencies.extend(out)
+
+    threads = [threading.Thread(target=run) for _ in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return len(latencies) / elapsed, latencies, len(failures)
+
+@benchmark
+def server_concurrency():
+    registry = server.Registry(name="bench")
+
+    @registry.add()
+    def query(n):
+        time.sleep(0.005) # waiting on a database, say
+        return n
+
+    clients, per_client = 50, 20
+    print("{} concurrent clients, {} calls each, 5ms of waiting per call".format(clients, per_client))
+    print("  {:<16} {:>12} {:>12} {:>12} {:>10}".format('', 'requests/s', 'p50', 'p99', 'failed'))
+
+    for name, cls in (('Server', server.Server), ('PooledServer', server.PooledServer)):
+        server_thread = cls(registry.app(), port=0)
+        server_thread.start()
+        try:
+            rate, latencies, failed = load_test(server_thread.url + "bench/query", clients, per_client)
+        finally:
+            server_thread.stop()
+        p50 = latencies[len(latencies) // 2]
+        p99 = latencies[int(len(latencies) * 0.99)]
+        print("  {:<16} {:>12.1f} {:>10.1f}ms {:>10.1f}ms {:>10}".format(
+            name, rate, p50 * 1000, p99 * 1000, failed))
+
+@benchmark
+def batch_calls():
+    registry = server.Registry(name="bench")
+
+    @registry.add()
+    def add(a, b):
+        return a + b
+
+    print("rpc calls over http: one request per call vs one batch")
+    report_header('separate', 'batched')
+
+    server_thread = server.Server(registry.app(), port=0)
+    server_thread.start()
+    try:
+        c = client.Client()
+        url = server_thread.url + "bench/add"
+        for n in (10, 100, 1000):
+            requests = [dom.Request('POST', url, {}, {}, {'a': i, 'b': 1}) for i in range(n)]
+            def separate():
+                return [c.fetch(r) for r in requests]
+            def batched():
+                with c.Batch(server_thread.url + "bench/") as batch:
+                    results = [batch.fetch(r) for r in requests]
+                return [r.result() for r in results]
+            if separate() != batched():
+                raise AssertionError(n)
+            report('{} calls'.format(n), timeit(separate, min_seconds=0.1), timeit(batched, min_seconds=0.1))
+    finally:
+        server_thread.stop()
+
+@benchmark
+def conditional_get():
+    registry = server.Registry(name="bench")
+
+    @registry.add()
+    class Small(server.Singleton):
+        def __init__(self):
+            self.names = ['name{}'.format(i) for i in range(100)]
+
+    @registry.add()
+    class Large(server.Singleton):
+        def __init__(self):
+            self.names = ['name{}'.format(i) for i in range(50000)]
+            self._version = 1
+
+    print("repeated gets over http: no cache vs etags")
+    report_header('download', 'revalidate')
+
+    server_thread = server.Server(registry.app(), port=0)
+    server_thread.start()
+    try:
+        for name in ('Small', 'Large'):
+            url = server_thread.url + "bench/" + name
+            fresh, cached = client.Client(cache_size=None), client.Client()
+            request = dom.Request('GET', url, {}, {}, None)
+            if fresh.fetch(request).attributes != cached.fetch(request).attributes:
+                raise AssertionError(name)
+            report(name, timeit(lambda: fresh.fetch(request), min_seconds=0.2),
+                timeit(lambda: cached.fetch(request), min_seconds=0.2))
+    finally:
+        server_thread.stop()
+
+def make_service_tree(namespaces, methods):
+    """ a service of namespaces, each with a singleton, and methods between them """
+    def method(name):
+        def fn(self, a, b=None):
+            return a
+        fn.__name__ = name
+        return fn
+
+    def make_class(name, base, n, **members):
+        for i in range(n):
+            members['method{}'.format(i)] = method('method{}'.format(i))
+        return type(name, (base,), members)
+
+    per_class = methods // (2 * namespaces)
+    children = {}
+    for i in range(namespaces):
+        state = make_class('State{}'.format(i), server.Singleton, per_class)
+        children['Namespace{}'.format(i)] = make_class(
+            'Namespace{}'.format(i), server.Namespace, per_class, State=state)
+    return make_class('Tree', server.Service, 0, **children)
+
+@benchmark
+def cli_cache():
+    import contextlib
+    import io
+    import tempfile
+    from catbus import browser
+
+    registry = server.Registry(name="bench")
+    registry.add()(make_service_tree(10, 200))
+
+    print("cli commands: fetching descriptions vs a warm cache")
+    report_header('uncached', 'cached')
+
+    server_thread = server.Server(registry.app(), port=0)
+    server_thread.start()
+    try:
+        endpoint = server_thread.url + "bench/"
+        directory = tempfile.mkdtemp()
+        c = client.Client(cache_size=None)
+        def run(args, cache):
+            with contextlib.redirect_stdout(io.StringIO()):
+                browser.cli(c, endpoint, list(args), cache)
+        args = ['Tree:Namespace0:State:method0', '--a=1', '--b=2']
+        uncached = lambda: run(args, None)
+        cached = lambda: run(args, browser.DescriptionCache(endpoint, directory))
+        cached()
+        report(args[0], timeit(uncached, min_seconds=0.2), timeit(cached, min_seconds=0.2))
+    finally:
+        server_thread.stop()
+
+def clear_metadata(handler):
+    for nested in getattr(handler, 'for_path', {}).values():
+        clear_metadata(nested)
+    if hasattr(handler, 'metadata_cache'):
+        handler.metadata_cache.clear()
+
+@benchmark
+def service_embed():
+    from werkzeug.test import EnvironBuilder
+
+    registry = server.Registry(name="bench")
+    registry.add()(make_service_tree(10, 500))
+    handler = registry.for_path['Tree']
+    request = EnvironBuilder(path='/bench/Tree').get_request()
+
+    def cold():
+        clear_metadata(handler)
+        registry.handle(request)
+
+    def warm():
+        registry.handle(request)
+
+    print("service GET: metadata rebuilt per request vs cached")
+    report_header('rebuilt', 'cached')
+    report('tree of 500 methods', timeit(cold), timeit(warm))
+
+def make_deep_service(depth):
+    def leaf():
+        return 1
+    members = {'leaf': leaf}
+    for i in range(depth):
+        members = {'Level': type('Level{}'.format(i), (server.Service,), members)}
+    return members['Level']
+
+def make_wide_service(width):
+    members = {}
+    for i in range(width):
+        def fn():
+            return 1
+        members['fn{}'.format(i)] = fn
+    return type('Wide', (server.Service,), members)
+
+@benchmark
+def route_dispatch():
+    registry = server.Registry(name="bench")
+    registry.add()(make_deep_service(8))
+    registry.add()(make_wide_service(5000))
+    for i in range(5000):
+        def fn():
+            return 1
+        fn.__name__ = 'fn{}'.format(i)
+        registry.add()(fn)
+
+    def nested(path):
+        request = dom.Request('POST', path, {}, {}, None)
+        name = path.split('/',1)[0].split('.',1)[0]
+        return registry.for_path[name].on_request({}, request)
+
+    def trie(path):
+        handler, context, url = registry.route(path)
+        return handler.on_request(context, dom.Request('POST', url, {}, {}, None))
+
+    print("routing: nested on_request vs route trie")
+    report_header('nested', 'trie')
+
+    tests = [
+        ('service 8 deep', 'Level7/' + 'Level/' * 7 + 'leaf'),
+        ('service 5000 wide', 'Wide/fn4999'),
+        ('registry 5000 wide', 'fn4999'),
+    ]
+    for name, path in tests:
+        if nested(path) != trie(path):
+            raise AssertionError(name)
+        def run(route):
+            def _run():
+                for _ in range(10000):
+                    route(path)
+            return _run
+        report(name + ' x10000', timeit(run(nested)), timeit(run(trie)))
+
+def make_job_registry(n, compiled):
+    registry = server.Registry(name="bench")
+    jobs = {}
+
+    class Handler(server.Collection.dict_handler('name', jobs)):
+        if not compiled:
+            def embed(self, prefix, o):
+                """ the embed before templates: a dom.Resource per object """
+                if o is None or o is self.cls:
+                    return self.link(prefix)
+                links, actions = self.extract_actions(self.cls)
+                return dom.Resource(
+                    kind = self.cls.__name__,
+                    metadata = dict(
+                        id = self.key_for(o),
+                        collection = self.url(prefix),
+                        url = self.url_for(prefix, o),
+                        links = links,
+                        actions = actions,
+                    ),
+                    attributes = self.extract_attributes(o),
+                )
+
+    class Job:
+        def __init__(self, name, state='running', count=0):
+            self.name = name
+            self.state = state
+            self.count = count
+
+        @server.rpc(safe=True)
+        def status(self):
+            return self.state
+
+        def stop(self, reason=None):
+            self.state = 'stopped'
+
+    registry.register(Job, Handler)
+    for i in range(n):
+        jobs['job{}'.format(i)] = Job('job{}'.format(i), count=i)
+    return registry
+
+@benchmark
+def collection_list():
+    from werkzeug.test import EnvironBuilder
+
+    print("list pages: a dom.Resource per item vs compiled templates")
+    report_header('resources', 'templates')
+
+    for n in (10000, 50000):
+        before, after = make_job_registry(n, False), make_job_registry(n, True)
+        for content_type in (dom.CONTENT_TYPE, dom.BINARY_CONTENT_TYPE):
+            request = EnvironBuilder(path='/bench/Job/list', headers={'Accept': content_type}).get_request()
+            if before.handle(request).get_data() != after.handle(request).get_data():
+                raise AssertionError(content_type)
+            b = timeit(lambda: before.handle(request).get_data())
+            a = timeit(lambda: after.handle(request).get_data())
+            report('{} items, {}'.format(n, content_type.split('/')[1]), b, a)
+            print("  {:<32} {:>10.0f}/s {:>10.0f}/s".format('items per second', n / b, n / a))
+
+@benchmark
+def indexed_list():
+    Operator = dom.Operator
+    handlers = []
+    for make in (server.Collection.dict_handler, server.Collection.indexed_handler):
+        class Job:
+            def __init__(self, name, state, count):
+                self.name = name
+                self.state = state
+                self.count = count
+        if make is server.Collection.dict_handler:
+            handler = make('name', {})('Job', Job)
+        else:
+            handler = make('name', {}, hashed=['state'], ordered=['count'])('Job', Job)
+        for i in range(100000):
+            handler.create(dict(name='job{}'.format(i), state=('run', 'stop', 'wait')[i % 3], count=i))
+        handlers.append(handler)
+
+    print("list with a selector, 100000 items: scan vs index")
+    report_header('scan', 'index')
+
+    tests = [
+        ('count >= 99900', [Operator.GreaterEqualTo(key='count', value=99900)], None),
+        ('count in 10 values', [Operator.In(key='count', value=list(range(0, 100000, 10000)))], None),
+        ('state = stop, page of 100', [Operator.Equals(key='state', value='stop')], 100),
+    ]
+    for name, selector, limit in tests:
+        scan, index = handlers
+        if [j.name for j in scan.list(selector, limit, None).items] != \
+                [j.name for j in index.list(selector, limit, None).items]:
+            raise AssertionError(name)
+        report(name, timeit(lambda: scan.list(selector, limit, None)),
+            timeit(lambda: index.list(selector, limit, None)))
+
+@benchmark
+def dict_pages():
+    class Job:
+        def __init__(self, name):
+            self.name = name
+
+    items, page = 100000, 100
+    handler = server.Collection.dict_handler('name', {})('Job', Job)
+    handler.create_many(dict(name='job{:06d}'.format((i * 7919) % items)) for i in range(items))
+
+    print("pages of {} from a dict of {}: copy and heapq vs seek".format(page, items))
+    report_header('copy', 'seek')
+
+    for depth in (0, 50000, 99000):
+        token = dom.dump('job{:06d}'.format(depth - 1)) if depth else None
+        copy = lambda: handler.page(list(handler.items.items()), None, page, token)
+        seek = lambda: handler.list(None, page, token)
+        if [j.name for j in copy().items] != [j.name for j in seek().items]:
+            raise AssertionError(depth)
+        report('page at item {}'.format(depth), timeit(copy), timeit(seek))
+
+@benchmark
+def peewee_pages():
+    import tempfile
+    import peewee
+
+    rows, page = 1000000, 100
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    db = peewee.SqliteDatabase(path)
+
+    class Person(peewee.Model):
+        class Meta: database = db
+        uuid = peewee.UUIDField(primary_key=True, default=uuid.uuid4)
+        name = peewee.CharField(index=True)
+
+    db.connect()
+    db.create_tables([Person])
+    with db.atomic():
+        db.cursor().executemany('INSERT INTO person (uuid, name) VALUES (?, ?)',
+            ((uuid.uuid4().hex, 'person{:07d}'.format((i * 7919) % rows)) for i in range(rows)))
+    handler = server.Model.PeeweeHandler('Person', Person)
+
+    print("pages of {} rows by name, from {} rows: offset vs keyset".format(page, rows))
+    report_header('offset', 'keyset')
+
+    order = Person.select().order_by(Person.name, Person.uuid)
+    for depth in (0, 10000, 500000, 990000):
+        token = None
+        if depth:
+            last = list(order.offset(depth - 1).limit(1))[0]
+            token = dom.dump(['name', last.name, last.uuid.hex])
+        offset = lambda: list(order.offset(depth).limit(page))
+        keyset = lambda: handler.list(None, page, token, order='name')
+        if [p.uuid for p in offset()] != [p.uuid for p in keyset().items]:
+            raise AssertionError(depth)
+        report('page at row {}'.format(depth), timeit(offset), timeit(keyset))
+
+    db.close()
+    os.remove(path)
+
+@benchmark
+def peewee_bulk_create():
+    import tempfile
+    import peewee
+
+    rows = 10000
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    db = peewee.SqliteDatabase(path)
+
+    class Person(peewee.Model):
+        class Meta: database = db
+        uuid = peewee.UUIDField(primary_key=True, default=uuid.uuid4)
+        name = peewee.CharField(index=True)
+        job = peewee.CharField()
+
+    db.connect()
+    db.create_tables([Person])
+    handler = server.Model.PeeweeHandler('Person', Person)
+    records = [{'name': 'person{}'.format(i), 'job': 'job{}'.format(i % 10)} for i in range(rows)]
+
+    def one_by_one():
+        Person.delete().execute()
+        for data in records:
+            handler.create(data)
+    def bulk():
+        Person.delete().execute()
+        handler.create_many(records)
+
+    print("creating {} rows in sqlite: create per row vs create_many".format(rows))
+    report_header('create', 'create_many')
+    report('{} rows'.format(rows), timeit(one_by_one, min_seconds=0), timeit(bulk, min_seconds=0))
+    if Person.select().count() != rows:
+        raise AssertionError(rows)
+
+    db.close()
+    os.remove(path)
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or list(benchmarks)
+    for name in names:
+        benchmarks[name]()
+        print()
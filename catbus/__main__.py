@@ -4,5 +4,8 @@ import sys
 if __name__ == '__main__':
     from . import browser, client
     endpoint = os.environ['CATBUS_URL']
-    sys.exit(browser.cli(client.Client(), endpoint, sys.argv[1:]))
+    # CATBUS_CACHE= turns off the cache of service descriptions
+    directory = os.environ.get('CATBUS_CACHE')
+    cache = browser.DescriptionCache(endpoint, directory or None) if directory != '' else None
+    sys.exit(browser.cli(client.Client(), endpoint, sys.argv[1:], cache))
     
@@ -1,8 +1,10 @@
 import os
 import sys
 import time
+import hashlib
+import tempfile
 
-from urllib.parse import urljoin
+from urllib.parse import urljoin, urlencode
 
 import requests
 
@@ -71,11 +73,83 @@ class Action:
         self.verb = verb
         self.arguments = arguments
 
-def cli(c, endpoint, args):
-
-    actions = parse_arguments(args)
-
-    obj = c.Get(endpoint)
+class DescriptionCache:
+    """ the index, namespaces and datasets the cli has navigated through,
+    kept in a file for each endpoint, so that a command can find its way
+    to the call it makes without fetching them again.
+
+    descriptions younger than max_age seconds are used as they are, and
+    older ones are revalidated with their ETag """
+    max_age = 600
+
+    def __init__(self, endpoint, directory=None):
+        if directory is None:
+            cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+            directory = os.path.join(cache_home, 'catbus')
+        name = hashlib.sha1(endpoint.encode('utf-8')).hexdigest()[:16]
+        self.directory = directory
+        self.path = os.path.join(directory, name + '.rson')
+        self.entries = {} # key -> [fetched, etag, content_type, url, content]
+        self.trusted = True
+        self.used = False
+        self.changed = False
+        self.called = False # once a call is sent, the command isn't run again
+        try:
+            with open(self.path, 'rb') as fh:
+                self.entries = dom.parse(fh.read().decode('utf-8'))
+        except Exception:
+            pass
+
+    def key(self, request):
+        if request.params:
+            return "{}?{}".format(request.url, urlencode(sorted(request.params.items())))
+        return request.url
+
+    def fetch(self, c, request):
+        """ like c.Call(request), for a GET of a description, but from the
+        file if it's there, returning (obj, whether it was used as is) """
+        key = self.key(request)
+        entry = self.entries.get(key)
+        if entry is not None and self.trusted and time.time() - entry[0] < self.max_age:
+            self.used = True
+            return self.parse(c, entry), True
+
+        headers = {'If-None-Match': entry[1]} if entry is not None else {}
+        result = c.send(dom.Request('GET', request.url, request.params, headers, None))
+        if result.status_code == 304 and entry is not None:
+            entry[0] = time.time()
+            self.changed = True
+            return self.parse(c, entry), False
+        result.raise_for_status()
+
+        entry = [time.time(), result.headers.get('ETag'), result.headers.get('Content-Type'), result.url, result.content]
+        obj = self.parse(c, entry)
+        if entry[1] and isinstance(obj, (client.RemoteObject, client.RemoteDataset)):
+            self.entries[key] = entry
+            self.changed = True
+        return obj, False
+
+    def parse(self, c, entry):
+        fetched, etag, content_type, url, content = entry
+        return dom.codec_for(content_type).parse_bytes(content, c.transform_for(url))
+
+    def save(self):
+        if not self.changed:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        fd, path = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, 'wb') as fh:
+            fh.write(dom.dump(self.entries).encode('utf-8'))
+        os.replace(path, self.path)
+        self.changed = False
+
+def navigate(c, endpoint, actions, cache):
+    """ performs the actions, returning the result of the last one """
+    request = dom.Request('GET', endpoint, {}, {}, None)
+    if cache is None:
+        obj, cached = c.Get(request), False
+    else:
+        obj, cached = cache.fetch(c, request)
 
     for action in actions[:-1]:
         if isinstance(obj, client.Navigable):
@@ -83,7 +157,15 @@ def cli(c, endpoint, args):
             # print('DEBUG', action.path, request.url)
         else:
             raise Exception('can\'t navigate to {}'.format(action.path))
-        obj = c.Call(request)
+        if cache is None:
+            obj = c.Call(request)
+        elif isinstance(request, client.CachedResult):
+            obj = request.result # embedded in obj, and as fresh as it
+        elif request.method != 'GET':
+            cache.called = True
+            obj, cached = c.Call(request), False # a call, not a description
+        else:
+            obj, cached = cache.fetch(c, request)
 
     if actions:
         action = actions[-1]
@@ -91,11 +173,38 @@ def cli(c, endpoint, args):
         if isinstance(attr, client.Navigable):
             request = obj.perform(action)
             # print('DEBUG', action.path, request.url)
+            if cache is not None:
+                cache.called = True
             obj = c.Call(request)
         elif not action.verb:
+            if cached and isinstance(obj, client.RemoteObject):
+                # attributes are read from a fresh copy
+                cache.trusted = False
+                obj, cached = cache.fetch(c, dom.Request('GET', obj.url, {}, {}, None))
+                attr = getattr(obj, action.path)
             obj = attr
     if isinstance(obj, client.RemoteWaiter):
         obj  = c.Wait(obj)
+    return obj
+
+def cli(c, endpoint, args, cache=None):
+    """ cache is a DescriptionCache for the endpoint, or None """
+    actions = parse_arguments(args)
+
+    try:
+        obj = navigate(c, endpoint, actions, cache)
+    except (AttributeError, KeyError, requests.HTTPError) as e:
+        # a description in the cache is out of date: the server has
+        # no such method, or no such url. the command is run again only
+        # if it failed before sending a call, as they may not be repeated
+        stale = not isinstance(e, requests.HTTPError) or e.response.status_code in (404, 405, 410)
+        if cache is None or not cache.used or cache.called or not stale:
+            raise
+        cache.trusted = False
+        obj = navigate(c, endpoint, actions, cache)
+    finally:
+        if cache is not None:
+            cache.save()
 
     if isinstance(obj, client.Navigable):
         obj = obj.display()
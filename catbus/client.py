@@ -10,14 +10,59 @@ RemoteObject/RemoteFunction wrapper objects.
 import os
 import sys
 import time
+import gzip
+import asyncio
+import collections
+import itertools
+import threading
 
-from urllib.parse import urljoin
+from concurrent.futures import ThreadPoolExecutor, Future
+
+from urllib.parse import urljoin, urlsplit, parse_qsl
 
 import requests
+import requests.adapters
 
 from . import dom
 
 HEADERS={'Content-Type': dom.CONTENT_TYPE}
+CHUNK_SIZE=16384
+COMPRESS_MIN_SIZE=1024
+CACHE_SIZE=256
+
+# RemoteDataset.where(name__<suffix>=value) -> (operator, operator for not_where)
+where_operators = {
+    '': (dom.Operator.Equals, dom.Operator.NotEquals),
+    'lt': (dom.Operator.LessThan, dom.Operator.GreaterEqualTo),
+    'le': (dom.Operator.LessEqualTo, dom.Operator.GreaterThan),
+    'gt': (dom.Operator.GreaterThan, dom.Operator.LessEqualTo),
+    'ge': (dom.Operator.GreaterEqualTo, dom.Operator.LessThan),
+    'in': (dom.Operator.In, dom.Operator.NotIn),
+}
+
+def make_selector(names, name, value, negate=False):
+    """ the dom.Operator for a keyword argument to where/not_where """
+    name, _, suffix = name.partition('__')
+    if name not in names:
+        raise Exception('no')
+    if suffix == 'exists':
+        op = dom.Operator.Exists if bool(value) != negate else dom.Operator.NotExists
+        return op(key=name)
+    if suffix not in where_operators:
+        raise Exception('unknown comparison: {}'.format(suffix))
+    op = where_operators[suffix][negate]
+    if suffix == 'in':
+        value = list(value)
+    return op(key=name, value=value)
+
+def chunks(items, size):
+    """ yields lists of up to size items at a time """
+    items = iter(items)
+    while True:
+        chunk = list(itertools.islice(items, size))
+        if not chunk:
+            return
+        yield chunk
 
 def unwrap_request(method, request, data=None):
     if isinstance(request, dom.Request):
@@ -51,14 +96,55 @@ class Navigable:
             
         
 
+class ResponseCache:
+    """ the last `size` objects fetched by GETs that came with an ETag, by
+    url, so they can be revalidated with If-None-Match, not downloaded
+    again. the same object is returned each time, so it shouldn't be changed """
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def key(self, request):
+        params = request.params or {}
+        return (request.url, tuple(sorted((k, str(v)) for k, v in params.items() if v is not None)))
+
+    def get(self, key):
+        """ (etag, obj), or None """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
 class CachedResult(Navigable):
     def __init__(self, result):
         self.result = result
         self.url = "<cached>"
 
 class Client:
-    def __init__(self):
+    def __init__(self, content_type=dom.CONTENT_TYPE, compress_min_size=COMPRESS_MIN_SIZE, cache_size=CACHE_SIZE):
+        """ content_type is the format sent, and asked for in return:
+        rson by default, or dom.BINARY_CONTENT_TYPE between programs.
+        request bodies of compress_min_size or more are gzipped, None
+        turns this off. responses are decompressed by requests.
+        the last cache_size GETs with ETags are kept, and revalidated
+        rather than fetched again, None turns this off """
         self.session=requests.session()
+        self.codec = dom.codec_for(content_type)
+        self.compress_min_size = compress_min_size
+        self.cache = ResponseCache(cache_size) if cache_size else None
 
     def Get(self, request, key=None):
         if isinstance(request, CachedResult):
@@ -92,8 +178,51 @@ class Client:
 
         return self.fetch(request)
 
-    def Update(self, request, key=None, value=None):
-        raise Exception('unimplemented')
+    def CreateMany(self, request, records, batch=1000):
+        """ creates an object for each dict in records, which can be a
+        generator, sending batch of them to a request. returns how many
+        were created """
+        if not isinstance(request, RemoteDataset):
+            raise Exception('no')
+        count = 0
+        for chunk in chunks(records, batch):
+            count += self.fetch(request.create_many(chunk))
+        return count
+
+    def DeleteMany(self, request, keys, batch=1000):
+        """ deletes the objects with keys, batch of them to a request.
+        returns how many were deleted """
+        if not isinstance(request, RemoteDataset):
+            raise Exception('no')
+        count = 0
+        for chunk in chunks(keys, batch):
+            count += self.fetch(request.delete_many(chunk))
+        return count
+
+    def Update(self, request, key=None, value=None, where=None):
+        """ sets the attributes in value, and no others, on an object, or
+        on the one with key in a dataset. where makes it conditional, and
+        the server answers 412 if the object doesn't match it, a version
+        number say. without a key, every object in a dataset that matches
+        where is updated, and the number of them returned """
+        if not isinstance(value, dict) or not value:
+            raise Exception('missing value')
+        if key and isinstance(request, RemoteDataset):
+            request = request.update(key, value, where=where)
+        elif isinstance(request, RemoteDataset):
+            request = request.update_list(value, where=where)
+        elif key:
+            raise Exception('first argument not a dataset/collection')
+        else:
+            request = unwrap_request('PATCH', request, value)
+            if where:
+                if not isinstance(where, str):
+                    where = dom.dump_selector(where)
+                request.params['where'] = where
+        if request.method != 'PATCH':
+            raise Exception('mismatch')
+
+        return self.fetch(request)
 
     def Delete(self, request, key=None, where=None):
         if key and where:
@@ -110,23 +239,23 @@ class Client:
 
         return self.fetch(request)
 
-    def List(self, request, where=None, batch=None):
+    def List(self, request, where=None, batch=None, order=None, fields=None):
         if isinstance(request, RemoteDataset):
-            request = request.list(where=where, batch=batch)
-        elif instance(obj, dom.Request):
+            request = request.list(where=where, batch=batch, order=order, fields=fields)
+        elif isinstance(request, dom.Request):
             pass
         else:
             raise Exception('no')
 
         # while ... keep returning them
-        obj = self.fetch(request)
+        obj = yield from self.fetch_items(request)
         if isinstance(obj, RemoteCursor):
             while obj:
                 for x in obj.values():
                     yield x
                 request = obj.next(batch)
                 if request:
-                    obj = self.fetch(request)
+                    obj = yield from self.fetch_items(request)
                 else:
                     obj = None
         else:
@@ -168,17 +297,39 @@ class Client:
 
         obj = self.fetch(request)
         while isinstance(obj, RemoteWaiter):
-            wait = obj.metadata.get('wait_seconds', poll_seconds)
-            wait  = max(poll_seconds, wait)
-            time.sleep(wait) # fixme
-            request = obj()
+            request, wait = obj.poll(poll_seconds)
+            if wait:
+                time.sleep(wait)
             obj = self.fetch(request)
         return obj
 
 
 
-    def Watch(self, request):
-        raise Exception('no')
+    def Watch(self, request, where=None, since=None):
+        """ yields a dom.Change for each change to a collection, from now,
+        or after the change with the token since. reconnects when the
+        server ends the watch, carrying on from the last change seen """
+        if not isinstance(request, RemoteDataset):
+            raise Exception('no')
+
+        while True:
+            seen = since
+            changes = self.fetch_items(request.watch(where=where, since=since), chunk_size=None)
+            try:
+                while True:
+                    change = next(changes)
+                    since = change.token
+                    yield change
+            except StopIteration as end:
+                if since is None and end.value is not None:
+                    since = end.value.obj.metadata.get('since')
+            except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError):
+                time.sleep(1)
+                continue
+            if since == seen:
+                # nothing new: a server that can't hold a watch open
+                # answers at once, so it is polled instead
+                time.sleep(1)
 
     def Post(self, request, data=None):
         request = unwrap_request('POST', request, data)
@@ -188,8 +339,16 @@ class Client:
         
         return self.fetch(request)
 
-    def fetch(self, request):
+    def Batch(self, service):
+        """ a Batch of calls to the service (its index, or url), sent
+        together in one request """
+        return Batch(self, service)
+
+    def send(self, request, stream=False):
         headers = dict(HEADERS)
+        if self.codec.content_type != dom.CONTENT_TYPE:
+            headers['Content-Type'] = self.codec.content_type
+            headers['Accept'] = "{}, {};q=0.5".format(self.codec.content_type, dom.CONTENT_TYPE)
         if request.headers:
             headers.update(request.headers)
         
@@ -198,31 +357,85 @@ class Client:
         params = request.params
         
         if request.data is not None:
-            data = dom.dump(request.data)
+            data = self.codec.dump(request.data)
+            if isinstance(data, str):
+                data = data.encode('utf-8')
+            if self.compress_min_size is not None and len(data) >= self.compress_min_size:
+                data = gzip.compress(data, 6)
+                headers['Content-Encoding'] = 'gzip'
         else:
             data = None
 
         # print('DEBUG', 'Fetching', url)
 
-        result = self.session.request(
+        return self.session.request(
                 method, 
                 url, 
                 params=params, 
                 headers=headers, 
-                data=data
+                data=data,
+                stream=stream,
         )
 
+    def fetch(self, request):
+        key = cached = None
+        if request.method == 'GET' and self.cache is not None:
+            key = self.cache.key(request)
+            cached = self.cache.get(key)
+            if cached is not None:
+                headers = dict(request.headers or {})
+                headers['If-None-Match'] = cached[0]
+                request = dom.Request(request.method, request.url, request.params, headers, request.data)
+
+        result = self.send(request)
+
         if result.status_code == 204:
             return None
+        if result.status_code == 304 and cached is not None:
+            return cached[1]
+        result.raise_for_status()
 
+        #print(result.text)
+        #print()
+        codec = dom.codec_for(result.headers.get('Content-Type'))
+        obj = codec.parse_bytes(result.content, self.transform_for(result.url))
+
+        etag = result.headers.get('ETag')
+        if key is not None and etag:
+            self.cache.put(key, (etag, obj))
+        return obj
+
+    def fetch_items(self, request, chunk_size=CHUNK_SIZE):
+        """like fetch, but the items of a cursor are yielded as they are
+        downloaded, rather than kept in it. returns the fetched object.
+
+        chunk_size=None reads whatever has arrived, rather than waiting
+        for chunk_size bytes"""
+        result = self.send(request, stream=True)
+
+        try:
+            if result.status_code == 204:
+                return None
+            result.raise_for_status()
+
+            codec = dom.codec_for(result.headers.get('Content-Type'))
+            decoder = codec.decoder(self.transform_for(result.url))
+            for chunk in result.iter_content(chunk_size):
+                yield from decoder.feed(chunk)
+            yield from decoder.close()
+            return decoder.value
+        finally:
+            result.close()
+
+    def transform_for(self, base_url):
         def transform(obj):
             if not isinstance(obj, dom.Hyperlink):
                 return obj
 
             if isinstance(obj, dom.Cursor):
-                return RemoteCursor(obj.kind, result.url, obj)
+                return RemoteCursor(obj.kind, base_url, obj)
 
-            url = urljoin(result.url, obj.url)
+            url = urljoin(base_url, obj.url)
 
             if isinstance(obj, dom.Link):
                 return RemoteFunction('GET', url, [])
@@ -238,12 +451,112 @@ class Client:
                 return RemoteWaiter(obj, url) 
 
             return obj
+        return transform
+
+class BatchError(requests.HTTPError):
+    """ a call in a batch that failed, with the dom.Response sent back for it """
+    def __init__(self, response):
+        requests.HTTPError.__init__(self, '{} {}: {}'.format(response.code, response.status, response.data))
+        self.code = response.code
+        self.status = response.status
+        self.data = response.data
+
+def completed(result):
+    future = Future()
+    future.set_result(result)
+    return future
+
+class Batch(Client):
+    """ the verbs of a Client, but requests are kept until send_batch(),
+    or the end of a with block, and then sent together to the service,
+    in one request. each verb returns a Future, which raises a BatchError
+    if its call failed, without the other calls failing:
+
+        with client.Batch(s) as batch:
+            sums = [batch.Call(total.add(n)) for n in range(10)]
+            job = batch.Get(s.Job, 'x')
+        print([f.result() for f in sums])
+    """
+
+    def __init__(self, client, service):
+        # the client's settings, without a cache, as batched GETs are
+        # POSTed, and its session, to reuse its connections
+        Client.__init__(self, client.codec.content_type, client.compress_min_size, cache_size=None)
+        self.session = client.session
+        self.client = client
+        if hasattr(service, 'url'):
+            service = service.url
+        if not service.endswith('/'):
+            service += '/'
+        self.url = urljoin(service, '_batch')
+        self.pending = []
+
+    def __enter__(self):
+        return self
 
-        #print(result.text)
-        #print()
-        obj = dom.parse(result.text, transform)
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.send_batch()
+        else:
+            for request, future in self.pending:
+                future.cancel()
+            self.pending = []
 
-        return obj
+    def Get(self, request, key=None):
+        result = Client.Get(self, request, key)
+        return result if isinstance(result, Future) else completed(result)
+
+    def Call(self, request, method=None, data=None):
+        result = Client.Call(self, request, method, data)
+        return result if isinstance(result, Future) else completed(result)
+
+    def List(self, request, where=None, batch=None, order=None, fields=None):
+        raise Exception("can't list in a batch")
+
+    def Watch(self, request, where=None, since=None):
+        raise Exception("can't watch in a batch")
+
+    def Wait(self, request, poll_seconds=2):
+        raise Exception("can't wait in a batch")
+
+    def CreateMany(self, request, records, batch=1000):
+        raise Exception("can't create many in a batch")
+
+    def DeleteMany(self, request, keys, batch=1000):
+        raise Exception("can't delete many in a batch")
+
+    def fetch(self, request):
+        url = urlsplit(request.url)
+        params = dict(parse_qsl(url.query))
+        for key, value in (request.params or {}).items():
+            if value is not None:
+                params[key] = value if isinstance(value, str) else str(value)
+        future = Future()
+        self.pending.append((dom.Request(request.method, url.path, params, {}, request.data), future))
+        return future
+
+    def send_batch(self):
+        """ sends the calls made so far, and sets the results of their futures """
+        pending, self.pending = self.pending, []
+        if not pending:
+            return
+        try:
+            result = self.send(dom.Request('POST', self.url, {}, {}, [r for r, f in pending]))
+            result.raise_for_status()
+            codec = dom.codec_for(result.headers.get('Content-Type'))
+            responses = codec.parse_bytes(result.content, self.transform_for(result.url))
+            if len(responses) != len(pending):
+                raise Exception('mismatch')
+        except Exception as e:
+            for request, future in pending:
+                future.set_exception(e)
+            raise
+
+        for (request, future), response in zip(pending, responses):
+            if response.code >= 400:
+                future.set_exception(BatchError(response))
+            else:
+                future.set_result(response.data)
 
 class RemoteWaiter(Navigable):
     def __init__(self, obj, url):
@@ -257,8 +570,19 @@ class RemoteWaiter(Navigable):
     def __str__(self):
         return "<Waiting for {}>".format(self.url)
 
-    def __call__(self, *args, **kwargs):
-        return dom.Request('GET', self.url, {}, {}, None)
+    def __call__(self, timeout=None):
+        params = {}
+        if timeout:
+            params['_timeout'] = str(timeout)
+        return dom.Request('GET', self.url, params, {}, None)
+
+    def poll(self, poll_seconds):
+        """ returns the request for the result, and how long to wait
+        before sending it. long polls are sent right away """
+        long_poll = self.metadata.get('long_poll_seconds')
+        if long_poll:
+            return self(timeout=long_poll), 0
+        return self(), self.metadata.get('wait_seconds', poll_seconds)
 
 class RemoteFunction(Navigable):
     def __init__(self, method, url, arguments, defaults=(), cached=None):
@@ -307,9 +631,11 @@ class RemoteDataset(Navigable):
     def __call__(self, *args, **kwargs):
         return self.create(*args, **kwargs)
 
-    def lookup(self, name):
+    def lookup(self, name, fields=None):
+        """ fields is a list of the attributes to fetch, or None for all """
         url = "{}/id/{}".format(self.url, name)
-        return dom.Request('GET', url, {}, {}, None)
+        params = {'fields': ','.join(fields)} if fields else {}
+        return dom.Request('GET', url, params, {}, None)
     
     def create(self, *args, **kwargs):
         url = "{}/new".format(self.url)
@@ -322,15 +648,31 @@ class RemoteDataset(Navigable):
         data.update(kwargs)
         return dom.Request('POST', url, {}, {}, data)
 
+    def create_many(self, records):
+        """ records is a list of dicts, one for each object """
+        url = "{}/new".format(self.url)
+        return dom.Request('POST', url, {}, {}, list(records))
+
     def delete(self, name):
         url = "{}/id/{}".format(self.url, name)
         return dom.Request('DELETE', url, {}, {}, None)
 
+    def update(self, name, changes, where=None):
+        url = "{}/id/{}".format(self.url, name)
+        params = self.get_params(where, None)
+        return dom.Request('PATCH', url, params, {}, changes)
+
+    def delete_many(self, names):
+        url = "{}/delete".format(self.url)
+        return dom.Request('POST', url, {}, {}, list(names))
+
     def get_params(self, selector, batch):
         params = dict()
         if selector and self.selectors:
             raise Exception('no')
         if selector:
+            if not isinstance(selector, str):
+                selector = dom.dump_selector(selector)
             params['where'] = selector
         if self.selectors: 
             params['where'] = dom.dump_selector(self.selectors)
@@ -345,9 +687,29 @@ class RemoteDataset(Navigable):
             raise Exception('missing where')
         return dom.Request('DELETE', url, params, {}, None)
 
-    def list(self, where=None, batch=None):
+    def update_list(self, changes, where=None):
+        url = "{}/list".format(self.url)
+        params = self.get_params(where, None)
+        if 'where' not in params:
+            raise Exception('missing where')
+        return dom.Request('PATCH', url, params, {}, changes)
+
+    def list(self, where=None, batch=None, order=None, fields=None):
+        """ order is an indexed field to sort by, or -field for descending.
+        fields is a list of the attributes to fetch, or None for all """
         url = "{}/list".format(self.url)
         params = self.get_params(where, batch)
+        if order:
+            params['order'] = order
+        if fields:
+            params['fields'] = ','.join(fields)
+        return dom.Request('GET', url, params, {}, None)
+
+    def watch(self, where=None, since=None):
+        url = "{}/watch".format(self.url)
+        params = self.get_params(where, None)
+        if since:
+            params['since'] = since
         return dom.Request('GET', url, params, {}, None)
 
     def next(self, batch=None):
@@ -356,32 +718,25 @@ class RemoteDataset(Navigable):
         return self.list(batch)
 
     def where(self, **kwargs):
+        """ narrows the dataset: name=value, or name__lt, __le, __gt,
+        __ge, __in=value, or name__exists=True """
         new_selectors = []
         new_selectors.extend(self.selectors)
         names = self.obj.metadata['list']
         
         for name, value in kwargs.items():
-            if name not in names:
-                raise Exception('no')
-            new_selectors.append(dom.Operator.Equals(
-                key=name,
-                value=value,
-            ))
+            new_selectors.append(make_selector(names, name, value))
 
         return RemoteDataset(self.kind, self.url, self.obj, new_selectors)
 
     def not_where(self, **kwargs):
+        """ like where, but for the items that don't match """
         new_selectors = []
         new_selectors.extend(self.selectors)
         names = self.obj.metadata['list']
 
         for name, value in kwargs.items():
-            if name not in names:
-                raise Exception('no')
-            new_selectors.append(dom.Operator.NotEquals(
-                key=name,
-                value=value
-        ))
+            new_selectors.append(make_selector(names, name, value, negate=True))
         
         return RemoteDataset(self.kind, self.url, self.obj, new_selectors)
 
@@ -397,8 +752,10 @@ class RemoteCursor(Navigable):
             params = dict()
             url = urljoin(self.base_url, self.obj.metadata['collection'])
             #url = "{}/list".format(url)
-            params['selector'] = self.obj.metadata['selector']
+            params['where'] = self.obj.metadata['selector']
             params['continue'] = self.obj.metadata['continue']
+            if self.obj.metadata.get('fields'):
+                params['fields'] = ','.join(self.obj.metadata['fields'])
             if batch:
                 params['limit'] = batch
 
@@ -460,13 +817,105 @@ class RemoteObject(Navigable):
                 return RemoteFunction('POST', url, arguments)
         raise AttributeError('no')
 
+class AsyncClient:
+    """ the verbs of Client, as coroutines, so many requests can be made
+    at once with gather(). requests are sent by a Client on a pool of
+    `workers` threads, which share up to `workers` connections to each
+    host """
+
+    def __init__(self, content_type=dom.CONTENT_TYPE, compress_min_size=COMPRESS_MIN_SIZE, workers=16, cache_size=CACHE_SIZE):
+        self.client = Client(content_type, compress_min_size, cache_size)
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=workers, pool_block=True)
+        self.client.session.mount('http://', adapter)
+        self.client.session.mount('https://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='catbus-client')
+
+    async def run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, fn, *args)
+
+    async def gather(self, *calls):
+        """ awaits all of the calls at once, returning their results in order """
+        return await asyncio.gather(*calls)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        self.client.session.close()
+
+    async def Get(self, request, key=None):
+        return await self.run(self.client.Get, request, key)
+
+    async def Create(self, request, key=None, value=None):
+        return await self.run(self.client.Create, request, key, value)
+
+    async def Delete(self, request, key=None, where=None):
+        return await self.run(self.client.Delete, request, key, where)
+
+    async def Update(self, request, key=None, value=None, where=None):
+        return await self.run(self.client.Update, request, key, value, where)
+
+    async def CreateMany(self, request, records, batch=1000):
+        return await self.run(self.client.CreateMany, request, records, batch)
+
+    async def DeleteMany(self, request, keys, batch=1000):
+        return await self.run(self.client.DeleteMany, request, keys, batch)
+
+    async def Call(self, request, method=None, data=None):
+        return await self.run(self.client.Call, request, method, data)
+
+    async def Post(self, request, data=None):
+        return await self.run(self.client.Post, request, data)
+
+    async def List(self, request, where=None, batch=None, order=None, fields=None):
+        items = self.client.List(request, where, batch, order, fields)
+        done = object()
+        try:
+            while True:
+                item = await self.run(next, items, done)
+                if item is done:
+                    break
+                yield item
+        finally:
+            await self.run(items.close)
+
+    async def Watch(self, request, where=None, since=None):
+        changes = self.client.Watch(request, where, since)
+        done = object()
+        try:
+            while True:
+                change = await self.run(next, changes, done)
+                if change is done:
+                    break
+                yield change
+        finally:
+            await self.run(changes.close)
+
+    async def Wait(self, request, poll_seconds=2):
+        if isinstance(request, RemoteWaiter):
+            request = request()
+        else:
+            request = unwrap_request('GET', request)
+
+        if request.method != 'GET':
+            raise Exception('mismatch')
+
+        obj = await self.run(self.client.fetch, request)
+        while isinstance(obj, RemoteWaiter):
+            request, wait = obj.poll(poll_seconds)
+            if wait:
+                await asyncio.sleep(wait)
+            obj = await self.run(self.client.fetch, request)
+        return obj
+
 client = Client()
 
 Get = client.Get
 Set = client.Set
 Create = client.Create
+CreateMany = client.CreateMany
 Update = client.Update
 Delete = client.Delete
+DeleteMany = client.DeleteMany
 List = client.List
 Call = client.Call
 Wait = client.Wait
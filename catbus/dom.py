@@ -5,7 +5,7 @@ registry of objects sent/recieved on the wire.
 
 from urllib.parse import urljoin
 
-from .rson import Codec, reserved_tags, CONTENT_TYPE
+from .rson import Codec, BinaryCodec, Template, Slot, reserved_tags, CONTENT_TYPE, BINARY_CONTENT_TYPE
 
 import werkzeug.exceptions as wz
 
@@ -17,6 +17,10 @@ class NotImplemented(wz.NotImplemented):
     pass
 class MethodNotAllowed(wz.MethodNotAllowed): 
     pass
+class Gone(wz.Gone):
+    pass
+class PreconditionFailed(wz.PreconditionFailed):
+    pass
 
 class Registry:
     def __init__(self):
@@ -24,6 +28,17 @@ class Registry:
         self.tag_for = dict()
         self.codec = Codec(self.as_tagged, self.from_tagged)
         self.content_type = self.codec.content_type
+        self.binary = BinaryCodec(self.as_tagged, self.from_tagged)
+        self.codecs = {
+            self.codec.content_type: self.codec,
+            self.binary.content_type: self.binary,
+        }
+
+    def codec_for(self, content_type):
+        """ the codec for a Content-Type header, rson if unknown """
+        if content_type:
+            content_type = content_type.split(';', 1)[0].strip()
+        return self.codecs.get(content_type, self.codec)
 
     def parse(self, buf, transform):
         return self.codec.parse(buf, transform)
@@ -31,6 +46,12 @@ class Registry:
     def dump(self, obj, transform):
         return self.codec.dump(obj, transform)
 
+    def dump_iter(self, obj, transform):
+        return self.codec.dump_iter(obj, transform)
+
+    def decoder(self, transform):
+        return self.codec.decoder(transform)
+
     def add(self, name=None):
         def _add(cls):
             n = cls.__name__ if name is None else name
@@ -39,6 +60,8 @@ class Registry:
                     name, "Can't tag {} with {}, {} is reserved".format(cls, name, name))
             self.classes[n] = cls
             self.tag_for[cls] = n
+            for codec in self.codecs.values():
+                codec.add_tag(cls, n)
             return cls
         return _add
 
@@ -120,6 +143,15 @@ class Cursor(Hyperlink):
         self.items = items
         self.metadata = metadata
 
+@registry.add()
+class Change:
+    """ one item in a watch: event is create, update, or delete """
+    def __init__(self, event, id, token, item):
+        self.event = event
+        self.id = id
+        self.token = token
+        self.item = item
+
 @registry.add()
 class Namespace(Hyperlink):
     def __init__(self, kind, metadata, attributes):
@@ -234,6 +266,15 @@ def parse(obj, transform=None):
 def dump(obj, transform=None):
     return registry.dump(obj, transform)
 
+def dump_iter(obj, transform=None):
+    return registry.dump_iter(obj, transform)
+
+def decoder(transform=None):
+    return registry.decoder(transform)
+
+def codec_for(content_type):
+    return registry.codec_for(content_type)
+
 
 def parse_selector(string):
     if string is None or string == "*": return None
@@ -12,7 +12,10 @@ see spec/rson/md
 import re
 import io
 import base64
+import codecs
+import struct
 import sys
+import types
 
 if sys.version_info.minor > 6 or sys.version_info.minor == 6 and sys.implementation.name == 'cpython':
     OrderedDict = dict
@@ -24,6 +27,8 @@ from datetime import datetime, timedelta, timezone
 
 
 CONTENT_TYPE="application/rson"
+BINARY_CONTENT_TYPE="application/rson+binary"
+CHUNK_SIZE=65536
 
 reserved_tags = set("""
         bool int float complex
@@ -34,6 +39,7 @@ reserved_tags = set("""
 """.split())
 
 whitespace = re.compile(r"(?:\ |\t|\uFEFF|\r|\n|#[^\r\n]*(?:\r?\n|$))+")
+ws_chars = frozenset(" \t\uFEFF\r\n#")
 
 int_b2 = re.compile(r"0b[01][01_]*")
 int_b8 = re.compile(r"0o[0-7][0-7_]*")
@@ -43,11 +49,23 @@ int_b16 = re.compile(r"0x[0-9a-fA-F][0-9a-fA-F_]*")
 flt_b10 = re.compile(r"\.[\d_]+")
 exp_b10 = re.compile(r"[eE](?:\+|-)?[\d+_]")
 
+# int_b10, flt_b10, exp_b10 in one match, sign included
+num_b10 = re.compile(r"[-+]?\d[\d_]*(\.[\d_]+)?([eE](?:\+|-)?[\d+_])?")
+
 string_dq = re.compile(
     r'"(?:[^"\\\n\x00-\x1F\uD800-\uDFFF]|\\(?:[\'"\\/bfnrt]|\r?\n|x[0-9a-fA-F]{2}|u[0-9a-fA-F]{4}|U[0-9a-fA-F]{8}))*"')
 string_sq = re.compile(
     r"'(?:[^'\\\n\x00-\x1F\uD800-\uDFFF]|\\(?:[\"'\\/bfnrt]|\r?\n|x[0-9a-fA-F]{2}|u[0-9a-fA-F]{4}|U[0-9a-fA-F]{8}))*'")
 
+# fast paths for the iterative parser, anything else falls back to
+# parse_string/parse_number
+plain_string = re.compile(r'"([^"\\\n\x00-\x1F\uD800-\uDFFF]*)"')
+plain_int = re.compile(r"-?\d+(?![\w\.])")
+plain_key = re.compile(r'"([^"\\\n\x00-\x1F\uD800-\uDFFF]*)"(?:{ws})?:(?:{ws})?'.format(ws=whitespace.pattern))
+separator = re.compile(r"(?:{ws})?([,:\]}}])(?:{ws})?".format(ws=whitespace.pattern))
+
+utc_datetime = re.compile(r"\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\.\d{6}Z")
+
 tag_name = re.compile(r"@(?!\d)\w+[ ]+")
 identifier = re.compile(r"(?!\d)[\w\.]+")
 
@@ -89,11 +107,38 @@ escaped = {
     '\\': '\\\\',
 }
 
+# escaped, then any other control character as \xFF
+escape_table = {n: '\\x{:02X}'.format(n) for n in range(0x20)}
+escape_table.update((ord(c), e) for c, e in escaped.items())
+needs_escape = re.compile(r'[\x00-\x1F"\'\\]')
+
 builtin_names = {'null': None, 'true': True, 'false': False}
 builtin_values = {None: 'null', True: 'true', False: 'false'}
 
+# types dump_rson writes without looking inside (bool is an int)
+scalar_types = (str, int, float, complex, bytes, bytearray, datetime, timedelta)
+
+# Codec methods for each type, in the order subclasses are matched
+builtin_encoders = [
+    (str, 'dump_str'),
+    (int, 'dump_int'),
+    (float, 'dump_float'),
+    (complex, 'dump_complex'),
+    ((bytes, bytearray), 'dump_bytes'),
+    ((list, tuple), 'dump_list'),
+    (set, 'dump_set'),
+    (OrderedDict, 'dump_record'), # must be before dict
+    (dict, 'dump_dict'),
+    (datetime, 'dump_datetime'),
+    (timedelta, 'dump_timedelta'),
+    (types.GeneratorType, 'dump_stream'), # a list, written as it is made
+]
+
 # names -> Classes (take name, value as args)
 def parse_datetime(v):
+    if utc_datetime.fullmatch(v):
+        # the format_datetime() output, without the cost of strptime
+        return datetime.fromisoformat(v[:-1]).replace(tzinfo=timezone.utc)
     if v[-1] == 'Z':
         if '.' in v:
             return datetime.strptime(v, "%Y-%m-%dT%H:%M:%S.%fZ").replace(tzinfo=timezone.utc)
@@ -119,6 +164,36 @@ class ParserErr(Exception):
                 repr(buf[pos]), repr(buf[pos - 10:pos + 5]))
         Exception.__init__(self, "{} (at pos={})".format(reason, pos))
 
+class SemanticErr(Exception):
+    pass
+
+# parser stack frame kinds
+_list, _set, _record = 'list', 'set', 'record'
+_no_key = object()
+
+class Slot:
+    """a place in a Template, filled by the nth value passed to fill()"""
+    def __init__(self, n):
+        self.n = n
+
+class Template:
+    """a value with Slots in it, for dumping many values of the same
+    shape: a codec encodes the parts between the slots once, and then
+    only the values given to fill() each time.
+
+    the template's own values are not passed through transform"""
+    def __init__(self, value):
+        self.value = value
+
+    def fill(self, *values):
+        return Filled(self, values)
+
+class Filled:
+    __slots__ = ('template', 'values')
+
+    def __init__(self, template, values):
+        self.template = template
+        self.values = values
 
 class Codec:
     content_type = CONTENT_TYPE
@@ -126,6 +201,14 @@ class Codec:
     def __init__(self, object_to_tagged, tagged_to_object):
         self.object_to_tagged = object_to_tagged
         self.tagged_to_object = tagged_to_object
+        self.tags = {}
+        self.templates = {}
+        self.encoders = {
+            type(None): self.dump_builtin,
+            bool: self.dump_builtin,
+            Slot: self.dump_slot,
+            Filled: self.dump_filled,
+        }
 
     def parse(self, buf, transform=None):
         obj, pos = self.parse_rson(buf, 0, transform)
@@ -142,12 +225,212 @@ class Codec:
         return obj
 
 
+    def decoder(self, transform=None, stream_key='items'):
+        return Decoder(self, transform, stream_key)
+
     def dump(self, obj, transform=None):
-        buf = io.StringIO('')
+        buf = self.buffer()
         self.dump_rson(obj, buf, transform)
         return buf.getvalue()
 
+    def buffer(self):
+        return io.StringIO('')
+
+    def parse_bytes(self, data, transform=None):
+        """parse a document as it came over the wire"""
+        return self.parse(data.decode('utf-8'), transform)
+
     def parse_rson(self, buf, pos, transform=None):
+        """parse one value, returning (value, end position)
+
+        open containers are kept on an explicit stack rather than the
+        python stack, so nesting depth is only limited by memory. each
+        frame is [out, name, kind, key], where key is the pending record
+        key, or _no_key while waiting for one.
+        """
+        stack = []
+        end = len(buf)
+        ws_match = whitespace.match
+        sep_match = separator.match
+        str_match = plain_string.match
+        int_match = plain_int.match
+        key_match = plain_key.match
+
+        while True:
+            if pos < end and buf[pos] in ws_chars:
+                m = ws_match(buf, pos)
+                if m:
+                    pos = m.end()
+            if pos >= end:
+                raise ParserErr(buf, pos, "Unexpected end of input")
+
+            peek = buf[pos]
+            name = None
+            if peek == '@':
+                m = tag_name.match(buf, pos)
+                if m:
+                    pos = m.end()
+                    name = buf[m.start() + 1:pos].rstrip()
+                else:
+                    raise ParserErr(buf, pos)
+                if pos >= end:
+                    raise ParserErr(buf, pos, "Unexpected end of input")
+                peek = buf[pos]
+                if peek == '@':
+                    raise ParserErr(buf, pos, "Cannot nest tags")
+
+            if peek == '"' or peek == "'":
+                m = str_match(buf, pos) if name is None else None
+                if m:
+                    value = m.group(1)
+                    pos = m.end()
+                else:
+                    value, pos = self.parse_string(buf, pos, name)
+
+            elif peek == '{' or peek == '[':
+                if peek == '{':
+                    if name in reserved_tags:
+                        if name not in ('object', 'record', 'dict'):
+                            raise ParserErr(
+                                buf, pos, "{} can't be used on objects".format(name))
+                    kind = _record
+                    close = '}'
+                    out = dict() if name == 'dict' else OrderedDict()
+                else:
+                    if name in reserved_tags:
+                        if name not in ('object', 'list', 'set', 'complex'):
+                            raise ParserErr(
+                                buf, pos, "{} can't be used on lists".format(name))
+                    if name == 'set':
+                        kind = _set
+                        out = set()
+                    else:
+                        kind = _list
+                        out = []
+                    close = ']'
+
+                pos += 1
+                if pos < end and buf[pos] in ws_chars:
+                    m = ws_match(buf, pos)
+                    if m:
+                        pos = m.end()
+                if pos >= end:
+                    raise ParserErr(buf, pos, "Unexpected end of input")
+                if buf[pos] != close:
+                    frame = [out, name, kind, _no_key]
+                    stack.append(frame)
+                    if kind is _record:
+                        m = key_match(buf, pos)
+                        if m:
+                            key = m.group(1)
+                            if transform is not None:
+                                key = transform(key)
+                            frame[3] = key
+                            pos = m.end()
+                    continue
+
+                pos += 1
+                value = self.finish_container(out, name, kind)
+
+            elif peek in "-+0123456789":
+                m = int_match(buf, pos) if name is None else None
+                if m:
+                    pos = m.end()
+                    value = int(buf[m.start():pos])
+                else:
+                    value, pos = self.parse_number(buf, pos, name)
+            else:
+                value, pos = self.parse_builtin(buf, pos, name)
+
+            if transform is not None:
+                value = transform(value)
+
+            # hand the finished value to the enclosing containers,
+            # closing each one that ends here
+            while True:
+                if not stack:
+                    return value, pos
+
+                frame = stack[-1]
+                out, kind = frame[0], frame[2]
+
+                m = sep_match(buf, pos)
+                if m is None:
+                    m = ws_match(buf, pos)
+                    if m:
+                        pos = m.end()
+                    if pos >= end:
+                        raise ParserErr(buf, pos, "Unexpected end of input")
+                    peek, at = buf[pos], pos
+                else:
+                    peek, at = m.group(1), m.start(1)
+
+                if kind is _record:
+                    key = frame[3]
+                    if key is _no_key:
+                        if value in out:
+                            raise SemanticErr('duplicate key: {}, {}'.format(value, out))
+                        if peek != ':':
+                            raise ParserErr(
+                                buf, at, "Expected key:value pair but found {}".format(repr(peek)))
+                        pos = m.end()
+                        frame[3] = value
+                        break
+                    out[key] = value
+                    frame[3] = _no_key
+                    close = '}'
+                elif kind is _set:
+                    if value in out:
+                        raise SemanticErr('duplicate item in set: {}'.format(value))
+                    out.add(value)
+                    close = ']'
+                else:
+                    out.append(value)
+                    close = ']'
+
+                if peek == ',':
+                    pos = m.end()
+                    if pos >= end:
+                        raise ParserErr(buf, pos, "Unexpected end of input")
+                    if buf[pos] != close:
+                        if kind is _record:
+                            m = key_match(buf, pos)
+                            if m:
+                                key = m.group(1)
+                                if transform is not None:
+                                    key = transform(key)
+                                if key in out:
+                                    raise SemanticErr('duplicate key: {}, {}'.format(key, out))
+                                frame[3] = key
+                                pos = m.end()
+                        break
+                elif peek != close:
+                    raise ParserErr(
+                        buf, at, "Expecting a ',', or a '{}' but found {}".format(close, repr(peek)))
+                else:
+                    pos = at
+
+                pos += 1
+                stack.pop()
+                value = self.finish_container(out, frame[1], kind)
+                if transform is not None:
+                    value = transform(value)
+
+    def finish_container(self, out, name, kind):
+        if kind is _record:
+            if name not in (None, 'object', 'record', 'dict'):
+                out = self.tagged_to_object(name, out)
+        elif name in (None, 'object', 'list', 'set'):
+            pass
+        elif name == 'complex':
+            out = complex(*out)
+        else:
+            out = self.tagged_to_object(name, out)
+        return out
+
+    def parse_recursive(self, buf, pos, transform=None):
+        """the original recursive descent parser, kept as a reference
+        implementation for parse_rson"""
         m = whitespace.match(buf, pos)
         if m:
             pos = m.end()
@@ -184,7 +467,7 @@ class Codec:
                 pos = m.end()
 
             while buf[pos] != '}':
-                key, pos = self.parse_rson(buf, pos, transform)
+                key, pos = self.parse_recursive(buf, pos, transform)
 
                 if key in out:
                     raise SemanticErr('duplicate key: {}, {}'.format(key, out))
@@ -203,10 +486,14 @@ class Codec:
                     raise ParserErr(
                         buf, pos, "Expected key:value pair but found {}".format(repr(peek)))
 
-                item, pos = self.parse_rson(buf, pos, transform)
+                item, pos = self.parse_recursive(buf, pos, transform)
 
                 out[key] = item
 
+                m = whitespace.match(buf, pos)
+                if m:
+                    pos = m.end()
+
                 peek = buf[pos]
                 if peek == ',':
                     pos += 1
@@ -215,9 +502,8 @@ class Codec:
                         pos = m.end()
                 elif peek != '}':
                     raise ParserErr(
-                        buf, pos, "Expecting a ',', or a '{}' but found {}".format('{}',repr(peek)))
-            if name not in (None, 'object', 'record', 'dict'):
-                out = self.tagged_to_object(name,  out)
+                        buf, pos, "Expecting a ',', or a '{}' but found {}".format('}',repr(peek)))
+            out = self.finish_container(out, name, _record)
             if transform is not None:
                 out = transform(out)
             return out, pos + 1
@@ -240,7 +526,7 @@ class Codec:
                 pos = m.end()
 
             while buf[pos] != ']':
-                item, pos = self.parse_rson(buf, pos, transform)
+                item, pos = self.parse_recursive(buf, pos, transform)
                 if name == 'set':
                     if item in out:
                         raise SemanticErr('duplicate item in set: {}'.format(item))
@@ -265,341 +551,1162 @@ class Codec:
 
             pos += 1
 
-            if name in (None, 'object', 'list', 'set'):
-                pass
-            elif name == 'complex':
-                out = complex(*out)
-            else:
-                out = self.tagged_to_object(name,  out)
+            out = self.finish_container(out, name, _list)
 
             if transform is not None:
                 out = transform(out)
             return out, pos
 
         elif peek == "'" or peek == '"':
-            if name in reserved_tags:
-                if name not in ('object', 'string', 'float', 'datetime', 'bytestring', 'base64'):
-                    raise ParserErr(
-                        buf, pos, "{} can't be used on strings".format(name))
+            out, end = self.parse_string(buf, pos, name)
+        elif peek in "-+0123456789":
+            out, end = self.parse_number(buf, pos, name)
+        else:
+            out, end = self.parse_builtin(buf, pos, name)
 
-            if name == 'bytestring':
-                s = bytearray()
-                ascii = True
-            else:
-                s = io.StringIO()
-                ascii = False
+        if transform is not None:
+            out = transform(out)
+        return out, end
 
-            # validate string
-            if peek == "'":
-                m = string_sq.match(buf, pos)
-                if m:
-                    end = m.end()
-                else:
-                    raise ParserErr(buf, pos, "Invalid single quoted string")
+    def parse_string(self, buf, pos, name=None):
+        peek = buf[pos]
+        if name in reserved_tags:
+            if name not in ('object', 'string', 'float', 'datetime', 'bytestring', 'base64'):
+                raise ParserErr(
+                    buf, pos, "{} can't be used on strings".format(name))
+
+        # validate string
+        if peek == "'":
+            m = string_sq.match(buf, pos)
+            if m:
+                end = m.end()
             else:
-                m = string_dq.match(buf, pos)
-                if m:
-                    end = m.end()
-                else:
-                    raise ParserErr(buf, pos, "Invalid double quoted string")
-
-            lo = pos + 1  # skip quotes
-            while lo < end - 1:
-                hi = buf.find("\\", lo, end)
-                if hi == -1:
-                    if ascii:
-                        s.extend(buf[lo:end - 1].encode('ascii'))
-                    else:
-                        s.write(buf[lo:end - 1])  # skip quote
-                    break
+                raise ParserErr(buf, pos, "Invalid single quoted string")
+        else:
+            m = string_dq.match(buf, pos)
+            if m:
+                end = m.end()
+            else:
+                raise ParserErr(buf, pos, "Invalid double quoted string")
 
-                if ascii:
-                    s.extend(buf[lo:hi].encode('ascii'))
-                else:
-                    s.write(buf[lo:hi])
+        if name is None and buf.find("\\", pos + 1, end) == -1:
+            return buf[pos + 1:end - 1], end
 
-                esc = buf[hi + 1]
-                if esc in str_escapes:
-                    if ascii:
-                        s.extend(byte_escapes[esc])
-                    else:
-                        s.write(str_escapes[esc])
-                    lo = hi + 2
-                elif esc == 'x':
-                    n = int(buf[hi + 2:hi + 4], 16)
-                    if ascii:
-                        s.append(n)
-                    else:
-                        s.write(chr(n))
-                    lo = hi + 4
-                elif esc == 'u':
-                    n = int(buf[hi + 2:hi + 6], 16)
-                    if ascii:
-                        if n > 0xFF:
-                            raise ParserErr(
-                                buf, hi, 'bytestring cannot have escape > 255')
-                        s.append(n)
-                    else:
-                        if 0xD800 <= n <= 0xDFFF:
-                            raise ParserErr(
-                                buf, hi, 'string cannot have surrogate pairs')
-                        s.write(chr(n))
-                    lo = hi + 6
-                elif esc == 'U':
-                    n = int(buf[hi + 2:hi + 10], 16)
-                    if ascii:
-                        if n > 0xFF:
-                            raise ParserErr(
-                                buf, hi, 'bytestring cannot have escape > 255')
-                        s.append(n)
-                    else:
-                        if 0xD800 <= n <= 0xDFFF:
-                            raise ParserErr(
-                                buf, hi, 'string cannot have surrogate pairs')
-                        s.write(chr(n))
-                    lo = hi + 10
-                elif esc == '\n':
-                    lo = hi + 2
-                elif (buf[hi + 1:hi + 3] == '\r\n'):
-                    lo = hi + 3
+        if name == 'bytestring':
+            s = bytearray()
+            ascii = True
+        else:
+            s = io.StringIO()
+            ascii = False
+
+        lo = pos + 1  # skip quotes
+        while lo < end - 1:
+            hi = buf.find("\\", lo, end)
+            if hi == -1:
+                if ascii:
+                    s.extend(buf[lo:end - 1].encode('ascii'))
                 else:
-                    raise ParserErr(
-                        buf, hi, "Unkown escape character {}".format(repr(esc)))
+                    s.write(buf[lo:end - 1])  # skip quote
+                break
 
-            if name == 'bytestring':
-                out = s
+            if ascii:
+                s.extend(buf[lo:hi].encode('ascii'))
             else:
-                out = s.getvalue()
+                s.write(buf[lo:hi])
 
-                if name in (None, 'string', 'object'):
-                    pass
-                elif name == 'base64':
-                    try:
-                        out = base64.standard_b64decode(out)
-                    except Exception as e:
-                        raise ParserErr(buf, pos, "Invalid base64") from e
-                elif name == 'datetime':
-                    try:
-                        out = parse_datetime(out)
-                    except Exception as e:
+            esc = buf[hi + 1]
+            if esc in str_escapes:
+                if ascii:
+                    s.extend(byte_escapes[esc])
+                else:
+                    s.write(str_escapes[esc])
+                lo = hi + 2
+            elif esc == 'x':
+                n = int(buf[hi + 2:hi + 4], 16)
+                if ascii:
+                    s.append(n)
+                else:
+                    s.write(chr(n))
+                lo = hi + 4
+            elif esc == 'u':
+                n = int(buf[hi + 2:hi + 6], 16)
+                if ascii:
+                    if n > 0xFF:
                         raise ParserErr(
-                            buf, pos, "Invalid datetime: {}".format(repr(out))) from e
-                elif name == 'float':
-                    m = c99_flt.match(out)
-                    if m:
-                        out = float.fromhex(out)
-                    else:
+                            buf, hi, 'bytestring cannot have escape > 255')
+                    s.append(n)
+                else:
+                    if 0xD800 <= n <= 0xDFFF:
                         raise ParserErr(
-                            buf, pos, "invalid C99 float literal: {}".format(out))
+                            buf, hi, 'string cannot have surrogate pairs')
+                    s.write(chr(n))
+                lo = hi + 6
+            elif esc == 'U':
+                n = int(buf[hi + 2:hi + 10], 16)
+                if ascii:
+                    if n > 0xFF:
+                        raise ParserErr(
+                            buf, hi, 'bytestring cannot have escape > 255')
+                    s.append(n)
                 else:
-                    out = self.tagged_to_object(name,  out)
+                    if 0xD800 <= n <= 0xDFFF:
+                        raise ParserErr(
+                            buf, hi, 'string cannot have surrogate pairs')
+                    s.write(chr(n))
+                lo = hi + 10
+            elif esc == '\n':
+                lo = hi + 2
+            elif (buf[hi + 1:hi + 3] == '\r\n'):
+                lo = hi + 3
+            else:
+                raise ParserErr(
+                    buf, hi, "Unkown escape character {}".format(repr(esc)))
 
-            if transform is not None:
-                out = transform(out)
-            return out, end
+        if name == 'bytestring':
+            out = s
+        else:
+            out = s.getvalue()
 
-        elif peek in "-+0123456789":
-            if name in reserved_tags:
-                if name not in ('object', 'int', 'float', 'duration'):
+            if name in (None, 'string', 'object'):
+                pass
+            elif name == 'base64':
+                try:
+                    out = base64.standard_b64decode(out)
+                except Exception as e:
+                    raise ParserErr(buf, pos, "Invalid base64") from e
+            elif name == 'datetime':
+                try:
+                    out = parse_datetime(out)
+                except Exception as e:
                     raise ParserErr(
-                        buf, pos, "{} can't be used on numbers".format(name))
+                        buf, pos, "Invalid datetime: {}".format(repr(out))) from e
+            elif name == 'float':
+                m = c99_flt.match(out)
+                if m:
+                    out = float.fromhex(out)
+                else:
+                    raise ParserErr(
+                        buf, pos, "invalid C99 float literal: {}".format(out))
+            else:
+                out = self.tagged_to_object(name,  out)
 
-            flt_end = None
-            exp_end = None
+        return out, end
 
-            sign = +1
+    def parse_number(self, buf, pos, name=None):
+        if name in reserved_tags:
+            if name not in ('object', 'int', 'float', 'duration'):
+                raise ParserErr(
+                    buf, pos, "{} can't be used on numbers".format(name))
 
-            if buf[pos] in "+-":
-                if buf[pos] == "-":
-                    sign = -1
-                pos += 1
-            peek = buf[pos:pos + 2]
+        is_float = False
+        sign = +1
+        start = pos
 
-            if peek in ('0x', '0o', '0b'):
-                if peek == '0x':
-                    base = 16
-                    m = int_b16.match(buf, pos)
-                    if m:
-                        end = m.end()
-                    else:
-                        raise ParserErr(
-                            buf, pos, "Invalid hexadecimal number (0x...)")
-                elif peek == '0o':
-                    base = 8
-                    m = int_b8.match(buf, pos)
-                    if m:
-                        end = m.end()
-                    else:
-                        raise ParserErr(buf, pos, "Invalid octal number (0o...)")
-                elif peek == '0b':
-                    base = 2
-                    m = int_b2.match(buf, pos)
-                    if m:
-                        end = m.end()
-                    else:
-                        raise ParserErr(
-                            buf, pos, "Invalid hexadecimal number (0x...)")
+        if buf[pos] in "+-":
+            if buf[pos] == "-":
+                sign = -1
+            pos += 1
+        peek = buf[pos:pos + 2]
 
-                out = sign * int(buf[pos + 2:end].replace('_', ''), base)
-            else:
-                m = int_b10.match(buf, pos)
+        if peek in ('0x', '0o', '0b'):
+            if peek == '0x':
+                base = 16
+                m = int_b16.match(buf, pos)
                 if m:
-                    int_end = m.end()
-                    end = int_end
+                    end = m.end()
                 else:
-                    raise ParserErr(buf, pos, "Invalid number")
-
-                t = flt_b10.match(buf, end)
-                if t:
-                    flt_end = t.end()
-                    end = flt_end
-
-                e = exp_b10.match(buf, end)
-                if e:
-                    exp_end = e.end()
-                    end = exp_end
-
-                if flt_end or exp_end:
-                    out = sign * float(buf[pos:end].replace('_', ''))
+                    raise ParserErr(
+                        buf, pos, "Invalid hexadecimal number (0x...)")
+            elif peek == '0o':
+                base = 8
+                m = int_b8.match(buf, pos)
+                if m:
+                    end = m.end()
+                else:
+                    raise ParserErr(buf, pos, "Invalid octal number (0o...)")
+            elif peek == '0b':
+                base = 2
+                m = int_b2.match(buf, pos)
+                if m:
+                    end = m.end()
                 else:
-                    out = sign * int(buf[pos:end].replace('_', ''), 10)
-
-            if name is None or name == 'object':
-                pass
-            elif name == 'duration':
-                out = timedelta(seconds=out)
-            elif name == 'int':
-                if flt_end or exp_end:
                     raise ParserErr(
-                        buf, pos, "Can't tag floating point with @int")
-            elif name == 'float':
-                if not isintance(out, float):
-                    out = float(out)
-            else:
-                out = self.tagged_to_object(name, out)
-
-            if transform is not None:
-                out = transform(out)
-            return out, end
+                        buf, pos, "Invalid hexadecimal number (0x...)")
 
+            out = sign * int(buf[pos + 2:end].replace('_', ''), base)
         else:
-            m = identifier.match(buf, pos)
+            m = num_b10.match(buf, start)
             if m:
                 end = m.end()
-                item = buf[pos:end]
             else:
-                raise ParserErr(buf, pos)
+                raise ParserErr(buf, pos, "Invalid number")
+
+            text = buf[start:end]
+            if '_' in text:
+                text = text.replace('_', '')
 
-            if item not in builtin_names:
+            if m.lastindex:
+                is_float = True
+                out = float(text)
+            else:
+                out = int(text, 10)
+
+        if name is None or name == 'object':
+            pass
+        elif name == 'duration':
+            out = timedelta(seconds=out)
+        elif name == 'int':
+            if is_float:
                 raise ParserErr(
-                    buf, pos, "{} is not a recognised built-in".format(repr(item)))
+                    buf, pos, "Can't tag floating point with @int")
+        elif name == 'float':
+            if not isinstance(out, float):
+                out = float(out)
+        else:
+            out = self.tagged_to_object(name, out)
 
-            out = builtin_names[item]
+        return out, end
 
-            if name is None or name == 'object':
-                pass
-            elif name == 'bool':
-                if item not in ('true', 'false'):
-                    raise ParserErr(buf, pos, '@bool can only true or false')
-            elif name in reserved_tags:
-                raise ParserErr(
-                    buf, pos, "{} has no meaning for {}".format(repr(name), item))
+    def parse_builtin(self, buf, pos, name=None):
+        m = identifier.match(buf, pos)
+        if m:
+            end = m.end()
+            item = buf[pos:end]
+        else:
+            raise ParserErr(buf, pos)
+
+        if item not in builtin_names:
+            raise ParserErr(
+                buf, pos, "{} is not a recognised built-in".format(repr(item)))
+
+        out = builtin_names[item]
+
+        if name is None or name == 'object':
+            pass
+        elif name == 'bool':
+            if item not in ('true', 'false'):
+                raise ParserErr(buf, pos, '@bool can only true or false')
+        elif name in reserved_tags:
+            raise ParserErr(
+                buf, pos, "{} has no meaning for {}".format(repr(name), item))
+        else:
+            out = self.tagged_to_object(name,  out)
+
+        return out, end
+
+
+    def dump_iter(self, obj, transform=None, chunk_size=CHUNK_SIZE):
+        """like dump, but yields the output as it is encoded, in
+        pieces of chunk_size (the last one may be shorter).
+
+        the items of a generator are sent as soon as they are encoded"""
+        buf = self.buffer()
+        rest = buf.getvalue()[:0]
+        for flush in self.dump_chunks(obj, buf, transform, chunk_size):
+            data = rest + buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+            n = len(data) if flush else len(data) - len(data) % chunk_size
+            for i in range(0, n, chunk_size):
+                yield data[i:i + chunk_size]
+            rest = data[n:]
+        data = rest + buf.getvalue()
+        for i in range(0, len(data), chunk_size):
+            yield data[i:i + chunk_size]
+
+    def dump_chunks(self, obj, buf, transform, chunk_size):
+        """dump_rson as a generator, yielding between the items of a
+        container whenever buf has chunk_size or more in it"""
+        if transform:
+            obj = transform(obj)
+        if obj is None or isinstance(obj, scalar_types):
+            # no children, so nothing left to transform
+            self.dump_rson(obj, buf)
+            return
+        if obj.__class__ is Filled:
+            self.dump_filled(obj, buf, transform)
+            return
+
+        flush = False
+        if isinstance(obj, (list, tuple)):
+            start, end, items = '[', ']', obj
+        elif isinstance(obj, types.GeneratorType):
+            start, end, items, flush = '[', ']', obj, True
+        elif isinstance(obj, set):
+            start, end, items = '@set [', ']', obj
+        elif isinstance(obj, OrderedDict): # must be before dict
+            start, end, items = '{', '}', obj.items()
+        elif isinstance(obj, dict):
+            start, end, items = '@dict {', '}', ((k, obj[k]) for k in sorted(obj.keys()))
+        else:
+            name = self.tags.get(type(obj))
+            if name is not None:
+                value = dict(obj.__dict__)
             else:
-                out = self.tagged_to_object(name,  out)
+                name, value = self.object_to_tagged(obj)
+            if not isinstance(value, OrderedDict) and isinstance(value, dict):
+                value = OrderedDict(value)
+            buf.write('@{} '.format(name))
+            yield from self.dump_chunks(value, buf, transform, chunk_size)
+            return
+
+        buf.write(start)
+        if flush:
+            yield True
+        first = True
+        record = end == '}'
+        for x in items:
+            if first:
+                first = False
+            else:
+                buf.write(", ")
+            if record:
+                k, v = x
+                self.dump_rson(k, buf, transform)
+                buf.write(": ")
+                yield from self.dump_chunks(v, buf, transform, chunk_size)
+            else:
+                yield from self.dump_chunks(x, buf, transform, chunk_size)
+            if flush:
+                yield True
+            elif buf.tell() >= chunk_size:
+                yield
+        buf.write(end)
 
-            if transform is not None:
-                out = transform(out)
-            return out, end
+    def dump_rson(self, obj, buf, transform=None):
+        if transform:
+            obj = transform(obj)
+        cls = type(obj)
+        encoder = self.encoders.get(cls)
+        if encoder is None:
+            encoder = self.encoder_for(cls)
+        encoder(obj, buf, transform)
+
+    def encoder_for(self, cls):
+        """find the encoder for a type without one of its own, by
+        checking its bases in the order dump_rson always has, and
+        falling back to object_to_tagged"""
+        for base, name in builtin_encoders:
+            if issubclass(cls, base):
+                encoder = getattr(self, name)
+                break
+        else:
+            encoder = self.dump_tagged
+        self.encoders[cls] = encoder
+        return encoder
+
+    def add_tag(self, cls, name):
+        """encode instances of cls (but not subclasses) as @name, with
+        their __dict__ as a record, as object_to_tagged would"""
+        prefix = '@{} '.format(name)
+        dump_rson = self.dump_rson
+
+        def dump_object(obj, buf, transform):
+            buf.write(prefix)
+            if transform:
+                dump_rson(dict(obj.__dict__), buf, transform)
+            else:
+                dump_rson(obj.__dict__, buf)
 
-        raise ParserErr(buf, pos)
+        self.tags[cls] = name
+        self.encoders[cls] = dump_object
 
+    def dump_builtin(self, obj, buf, transform=None):
+        buf.write(builtin_values[obj])
 
+    def dump_str(self, obj, buf, transform=None):
+        if needs_escape.search(obj):
+            obj = obj.translate(escape_table)
+        buf.write('"' + obj + '"')
 
-    def dump_rson(self, obj, buf, transform=None):
-        if transform:
-            obj = transform(obj)
-        if obj is True or obj is False or obj is None:
-            buf.write(builtin_values[obj])
-        elif isinstance(obj, str):
-            buf.write('"')
-            for c in obj:
-                if c in escaped:
-                    buf.write(escaped[c])
-                elif ord(c) < 0x20:
-                    buf.write('\\x{:02X}'.format(ord(c)))
-                else:
-                    buf.write(c)
-            buf.write('"')
-        elif isinstance(obj, int):
+    def dump_int(self, obj, buf, transform=None):
+        buf.write(str(obj))
+
+    def dump_float(self, obj, buf, transform=None):
+        hex = obj.hex()
+        if hex.startswith(('0', '-')):
             buf.write(str(obj))
-        elif isinstance(obj, float):
-            hex = obj.hex()
-            if hex.startswith(('0', '-')):
-                buf.write(str(obj))
+        else:
+            buf.write('@float "{}"'.format(hex))
+
+    def dump_complex(self, obj, buf, transform=None):
+        buf.write("@complex [{}, {}]".format(obj.real, obj.imag))
+
+    def dump_bytes(self, obj, buf, transform=None):
+        buf.write('@base64 "')
+        # assume no escaping needed
+        buf.write(base64.standard_b64encode(obj).decode('ascii'))
+        buf.write('"')
+
+    def dump_list(self, obj, buf, transform=None):
+        buf.write('[')
+        first = True
+        for x in obj:
+            if first:
+                first = False
             else:
-                buf.write('@float "{}"'.format(hex))
-        elif isinstance(obj, complex):
-            buf.write("@complex [{}, {}]".format(obj.real, obj.imag))
-        elif isinstance(obj, (bytes, bytearray)):
-            buf.write('@base64 "')
-            # assume no escaping needed
-            buf.write(base64.standard_b64encode(obj).decode('ascii'))
-            buf.write('"')
-        elif isinstance(obj, (list, tuple)):
-            buf.write('[')
-            first = True
-            for x in obj:
-                if first:
-                    first = False
+                buf.write(", ")
+            self.dump_rson(x, buf, transform)
+        buf.write(']')
+
+    def dump_stream(self, obj, buf, transform=None):
+        self.dump_list(obj, buf, transform)
+
+    def dump_set(self, obj, buf, transform=None):
+        buf.write('@set [')
+        first = True
+        for x in obj:
+            if first:
+                first = False
+            else:
+                buf.write(", ")
+            self.dump_rson(x, buf, transform)
+        buf.write(']')
+
+    def dump_record(self, obj, buf, transform=None):
+        buf.write('{')
+        first = True
+        for k, v in obj.items():
+            if first:
+                first = False
+            else:
+                buf.write(", ")
+            self.dump_rson(k, buf, transform)
+            buf.write(": ")
+            self.dump_rson(v, buf, transform)
+        buf.write('}')
+
+    def dump_dict(self, obj, buf, transform=None):
+        buf.write('@dict {')
+        first = True
+        for k in sorted(obj.keys()):
+            if first:
+                first = False
+            else:
+                buf.write(", ")
+            self.dump_rson(k, buf, transform)
+            buf.write(": ")
+            self.dump_rson(obj[k], buf, transform)
+        buf.write('}')
+
+    def dump_datetime(self, obj, buf, transform=None):
+        buf.write('@datetime "{}"'.format(format_datetime(obj)))
+
+    def dump_timedelta(self, obj, buf, transform=None):
+        buf.write('@duration {}'.format(obj.total_seconds()))
+
+    def dump_tagged(self, obj, buf, transform=None):
+        nv = self.object_to_tagged(obj)
+        name, value = nv
+        if not isinstance(value, OrderedDict) and isinstance(value, dict):
+            value = OrderedDict(value)
+        buf.write('@{} '.format(name))
+        self.dump_rson(value, buf, transform)  # XXX: prevent @foo @foo
+
+    def compile(self, template, buf):
+        """dump a template into buf, returning the parts between the
+        slots as a list of (part, slot number), and the part after"""
+        buf.marks = []
+        self.dump_rson(template.value, buf)
+        data = buf.getvalue()
+        parts, pos = [], 0
+        for end, n in buf.marks:
+            parts.append((data[pos:end], n))
+            pos = end
+        return parts, data[pos:]
+
+    def dump_slot(self, obj, buf, transform=None):
+        buf.marks.append((buf.tell(), obj.n))
+
+    def dump_filled(self, obj, buf, transform=None):
+        compiled = self.templates.get(obj.template)
+        if compiled is None:
+            compiled = self.templates[obj.template] = self.compile(obj.template, self.buffer())
+        parts, last = compiled
+        values, dump_rson = obj.values, self.dump_rson
+        for part, n in parts:
+            buf.write(part)
+            dump_rson(values[n], buf, transform)
+        buf.write(last)
+
+class Decoder:
+    """push parser for one rson document, fed bytes as they arrive
+
+    if the document is a record, the items of the list under its
+    stream_key (i.e the items of a cursor) are returned from feed()
+    as soon as each one has been parsed, and are not kept. close()
+    returns any remaining items, and afterwards `value` holds the
+    document, with that list left empty.
+
+    any other document is buffered, and parsed whole on close()
+    """
+
+    def __init__(self, codec, transform=None, stream_key='items'):
+        self.codec = codec
+        self.transform = transform
+        self.stream_key = stream_key
+        self.text = codecs.getincrementaldecoder('utf-8')()
+        self.buf = ''
+        self.pos = 0
+        self.state = 'start'
+        self.name = None
+        self.out = None
+        self.key = _no_key
+        self.wanted = 0
+        self.closed = False
+        self.value = None
+
+    def feed(self, chunk):
+        self.buf += self.text.decode(chunk)
+        return self.process()
+
+    def close(self):
+        self.buf += self.text.decode(b'', final=True)
+        self.closed = True
+        return self.process()
+
+    def attempt(self, pos, closed_ok=False):
+        """parse the value at pos, returning (value, position of the next
+        token), or None if the value, or the token after it, is incomplete
+
+        with closed_ok, a value ending in a bracket or a quote is complete
+        without the next token, and the position may be the end of buffer"""
+        buf = self.buf
+        if not self.closed and len(buf) - pos < self.wanted:
+            return None
+        try:
+            value, end = self.codec.parse_rson(buf, pos, self.transform)
+        except (ParserErr, SemanticErr):
+            if self.closed:
+                raise
+            # retry once there is twice as much to look at
+            self.wanted = 2 * (len(buf) - pos)
+            return None
+
+        if closed_ok and end >= len(buf) and buf[end - 1] in '}]"':
+            self.wanted = 0
+            return value, end
+        m = whitespace.match(buf, end)
+        if m:
+            end = m.end()
+        if end >= len(buf):
+            if self.closed:
+                raise ParserErr(buf, end, "Unexpected end of input")
+            # a number, or a comment, could be continued in the next chunk
+            self.wanted = len(buf) - pos + 1
+            return None
+        if buf[end] not in ',:]}' and not self.closed:
+            # as could a number: "1" then ".5"
+            self.wanted = 2 * (len(buf) - pos)
+            return None
+        self.wanted = 0
+        return value, end
+
+    def process(self):
+        items = []
+        transform = self.transform
+
+        while True:
+            buf, pos = self.buf, self.pos
+            state = self.state
+
+            if state == 'whole':
+                if self.closed:
+                    self.value = self.codec.parse(buf, transform)
+                    self.state = 'done'
+                break
+
+            m = whitespace.match(buf, pos)
+            if m:
+                if m.end() >= len(buf) and not self.closed:
+                    break
+                pos = m.end()
+            if pos >= len(buf):
+                if self.closed and state != 'done':
+                    raise ParserErr(buf, pos, "Unexpected end of input")
+                break
+            peek = buf[pos]
+
+            if state == 'start':
+                name = None
+                if peek == '@':
+                    m = tag_name.match(buf, pos)
+                    if not m or m.end() >= len(buf):
+                        if self.closed:
+                            self.state = 'whole'
+                            continue
+                        break
+                    pos = m.end()
+                    name = buf[m.start() + 1:pos].rstrip()
+                    peek = buf[pos]
+                if peek == '{' and (name not in reserved_tags or name == 'object'):
+                    self.name = name
+                    self.out = OrderedDict()
+                    self.pos = pos + 1
+                    self.state = 'key'
                 else:
-                    buf.write(", ")
-                self.dump_rson(x, buf, transform)
-            buf.write(']')
-        elif isinstance(obj, set):
-            buf.write('@set [')
-            first = True
-            for x in obj:
-                if first:
-                    first = False
+                    self.state = 'whole'
+
+            elif state == 'key':
+                if peek == '}':
+                    value = self.codec.finish_container(self.out, self.name, _record)
+                    if transform is not None:
+                        value = transform(value)
+                    self.value = value
+                    self.out = None
+                    self.pos = pos + 1
+                    self.state = 'done'
+                    continue
+                r = self.attempt(pos)
+                if r is None:
+                    break
+                key, pos = r
+                if key in self.out:
+                    raise SemanticErr('duplicate key: {}, {}'.format(key, self.out))
+                if buf[pos] != ':':
+                    raise ParserErr(
+                        buf, pos, "Expected key:value pair but found {}".format(repr(buf[pos])))
+                self.key = key
+                self.pos = pos + 1
+                self.state = 'value'
+
+            elif state == 'value':
+                if peek == '[' and self.key == self.stream_key:
+                    self.pos = pos + 1
+                    self.state = 'items'
+                    continue
+                r = self.attempt(pos)
+                if r is None:
+                    break
+                self.out[self.key], self.pos = r
+                self.key = _no_key
+                self.state = 'separator'
+
+            elif state == 'items':
+                if peek == ']':
+                    value = []
+                    if transform is not None:
+                        value = transform(value)
+                    self.out[self.key] = value
+                    self.key = _no_key
+                    self.pos = pos + 1
+                    self.state = 'separator'
+                    continue
+                r = self.attempt(pos, closed_ok=True)
+                if r is None:
+                    break
+                item, self.pos = r
+                items.append(item)
+                self.state = 'item_separator'
+
+            elif state == 'item_separator':
+                if peek == ',':
+                    self.pos = pos + 1
+                elif peek != ']':
+                    raise ParserErr(
+                        buf, pos, "Expecting a ',', or a ']' but found {}".format(repr(peek)))
                 else:
-                    buf.write(", ")
-                self.dump_rson(x, buf, transform)
-            buf.write(']')
-        elif isinstance(obj, OrderedDict): # must be before dict
-            buf.write('{')
-            first = True
-            for k, v in obj.items():
-                if first:
-                    first = False
+                    self.pos = pos
+                self.state = 'items'
+
+            elif state == 'separator':
+                if peek == ',':
+                    self.pos = pos + 1
+                elif peek != '}':
+                    raise ParserErr(
+                        buf, pos, "Expecting a ',', or a '}' but found {}".format(repr(peek)))
                 else:
-                    buf.write(", ")
-                self.dump_rson(k, buf, transform)
-                buf.write(": ")
-                self.dump_rson(v, buf, transform)
-            buf.write('}')
+                    self.pos = pos
+                self.state = 'key'
+
+            else:
+                raise ParserErr(buf, pos, "Trailing content: {}".format(
+                    repr(buf[pos:pos + 10])))
+
+        # drop what has been parsed, once it is most of the buffer
+        if self.state != 'whole' and self.pos > 65536 and self.pos * 2 > len(self.buf):
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+
+        return items
+
+# binary rson: the same values as rson, as a type byte followed by its
+# contents. lengths and counts are unsigned varints, ints, datetimes
+# (microseconds since the epoch) and durations (microseconds) are
+# zigzag varints, and floats are big endian doubles.
+#
+# record keys and tag names are interned: the first use of a string
+# is written as B_INTERN and takes the next index in the table, and
+# later uses as B_STRING_REF and that index.
+#
+# a list of unknown length (from a generator) is written as B_STREAM,
+# its items, then B_END.
+
+B_NULL, B_FALSE, B_TRUE = 0x00, 0x01, 0x02
+B_INT, B_FLOAT, B_COMPLEX = 0x03, 0x04, 0x05
+B_STRING, B_BYTES = 0x06, 0x07
+B_LIST, B_SET, B_RECORD, B_DICT = 0x08, 0x09, 0x0A, 0x0B
+B_DATETIME, B_DURATION = 0x0C, 0x0D
+B_TAG, B_INTERN, B_STRING_REF = 0x0E, 0x0F, 0x10
+B_STREAM, B_END = 0x11, 0x12
+
+binary_builtins = {None: bytes([B_NULL]), False: bytes([B_FALSE]), True: bytes([B_TRUE])}
+binary_containers = {B_LIST: _list, B_SET: _set, B_RECORD: _record, B_DICT: _record, B_STREAM: _list}
+
+epoch = datetime(1970, 1, 1, tzinfo=timezone.utc)
+double = struct.Struct(">d")
+double_pair = struct.Struct(">dd")
+
+# type byte and length/count, for the common small lengths
+small_headers = {t: [bytes([t, n]) for n in range(0x80)] for t in
+    (B_INT, B_STRING, B_BYTES, B_LIST, B_SET, B_RECORD, B_DICT, B_INTERN, B_STRING_REF)}
+
+def varint(n):
+    out = bytearray()
+    while n > 0x7F:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+    return bytes(out)
+
+def binary_header(t, n):
+    if n < 0x80:
+        return small_headers[t][n]
+    return bytes([t]) + varint(n)
+
+def zigzag(n):
+    return n << 1 if n >= 0 else ((-n) << 1) - 1
+
+def microseconds(delta):
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+class Incomplete(Exception):
+    pass
+
+def read_varint(buf, pos):
+    """ returns (n, position after it), IndexError if it is cut short """
+    b = buf[pos]
+    if b < 0x80:
+        return b, pos + 1
+    n, shift = 0, 0
+    while b >= 0x80:
+        n |= (b & 0x7F) << shift
+        shift += 7
+        pos += 1
+        b = buf[pos]
+    return n | (b << shift), pos + 1
+
+class BinaryBuffer(io.BytesIO):
+    """output buffer for one binary document, with its interned strings,
+    and the templates compiled against them"""
+    def __init__(self):
+        io.BytesIO.__init__(self)
+        self.strings = {}
+        self.templates = {}
+        self.filling = []
+
+class BinaryCodec(Codec):
+    """reads and writes binary rson, for when both ends are programs.
+
+    tags are handled as in Codec, through object_to_tagged and
+    tagged_to_object, and transform is applied in the same order"""
+
+    content_type = BINARY_CONTENT_TYPE
+
+    def buffer(self):
+        return BinaryBuffer()
+
+    def parse(self, buf, transform=None):
+        decoder = BinaryDecoder(self, transform, stream_key=None)
+        decoder.feed(buf)
+        decoder.close()
+        return decoder.value
+
+    def parse_bytes(self, data, transform=None):
+        return self.parse(data, transform)
+
+    def decoder(self, transform=None, stream_key='items'):
+        return BinaryDecoder(self, transform, stream_key)
+
+    def dump_chunks(self, obj, buf, transform, chunk_size):
+        if transform:
+            obj = transform(obj)
+        if obj is None or isinstance(obj, scalar_types):
+            self.dump_rson(obj, buf)
+            return
+        if obj.__class__ is Filled:
+            self.dump_filled(obj, buf, transform)
+            return
+
+        record = False
+        if isinstance(obj, (list, tuple)):
+            header, items = B_LIST, obj
+        elif isinstance(obj, types.GeneratorType):
+            buf.write(bytes([B_STREAM]))
+            yield True
+            for x in obj:
+                yield from self.dump_chunks(x, buf, transform, chunk_size)
+                yield True
+            buf.write(bytes([B_END]))
+            return
+        elif isinstance(obj, set):
+            header, items = B_SET, obj
+        elif isinstance(obj, OrderedDict): # must be before dict
+            header, items, record = B_RECORD, obj.items(), True
         elif isinstance(obj, dict):
-            buf.write('@dict {')
-            first = True
-            for k in sorted(obj.keys()):
-                if first:
-                    first = False
-                else:
-                    buf.write(", ")
-                self.dump_rson(k, buf, transform)
-                buf.write(": ")
-                self.dump_rson(obj[k], buf, transform)
-            buf.write('}')
-        elif isinstance(obj, datetime):
-            buf.write('@datetime "{}"'.format(format_datetime(obj)))
-        elif isinstance(obj, timedelta):
-            buf.write('@duration {}'.format(obj.total_seconds()))
+            header, items, record = B_DICT, ((k, obj[k]) for k in sorted(obj.keys())), True
         else:
-            nv = self.object_to_tagged(obj)
-            name, value = nv
+            name = self.tags.get(type(obj))
+            if name is not None:
+                value = dict(obj.__dict__)
+            else:
+                name, value = self.object_to_tagged(obj)
             if not isinstance(value, OrderedDict) and isinstance(value, dict):
                 value = OrderedDict(value)
-            buf.write('@{} '.format(name))
-            self.dump_rson(value, buf, transform)  # XXX: prevent @foo @foo
+            self.dump_name(name, buf)
+            yield from self.dump_chunks(value, buf, transform, chunk_size)
+            return
+
+        buf.write(binary_header(header, len(obj)))
+        for x in items:
+            if record:
+                k, v = x
+                self.dump_key(k, buf, transform)
+                yield from self.dump_chunks(v, buf, transform, chunk_size)
+            else:
+                yield from self.dump_chunks(x, buf, transform, chunk_size)
+            if buf.tell() >= chunk_size:
+                yield
+
+    def add_tag(self, cls, name):
+        dump_name = self.dump_name
+        dump_rson = self.dump_rson
+
+        def dump_object(obj, buf, transform):
+            dump_name(name, buf)
+            if transform:
+                dump_rson(dict(obj.__dict__), buf, transform)
+            else:
+                dump_rson(obj.__dict__, buf)
+
+        self.tags[cls] = name
+        self.encoders[cls] = dump_object
+
+    def dump_interned(self, obj, buf):
+        strings = buf.strings
+        index = strings.get(obj)
+        if index is None:
+            strings[obj] = len(strings)
+            data = obj.encode('utf-8')
+            buf.write(binary_header(B_INTERN, len(data)) + data)
+        else:
+            buf.write(binary_header(B_STRING_REF, index))
+
+    def dump_name(self, name, buf):
+        buf.write(b'\x0e')  # B_TAG
+        self.dump_interned(name, buf)
+
+    def dump_key(self, obj, buf, transform):
+        if transform:
+            obj = transform(obj)
+        cls = type(obj)
+        if cls is str:
+            self.dump_interned(obj, buf)
+        else:
+            encoder = self.encoders.get(cls)
+            if encoder is None:
+                encoder = self.encoder_for(cls)
+            encoder(obj, buf, transform)
+
+    def dump_builtin(self, obj, buf, transform=None):
+        buf.write(binary_builtins[obj])
+
+    def dump_str(self, obj, buf, transform=None):
+        data = obj.encode('utf-8')
+        buf.write(binary_header(B_STRING, len(data)) + data)
+
+    def dump_int(self, obj, buf, transform=None):
+        buf.write(binary_header(B_INT, zigzag(obj)))
+
+    def dump_float(self, obj, buf, transform=None):
+        buf.write(b'\x04' + double.pack(obj))  # B_FLOAT
+
+    def dump_complex(self, obj, buf, transform=None):
+        buf.write(b'\x05' + double_pair.pack(obj.real, obj.imag))  # B_COMPLEX
+
+    def dump_bytes(self, obj, buf, transform=None):
+        buf.write(binary_header(B_BYTES, len(obj)) + obj)
+
+    def dump_list(self, obj, buf, transform=None):
+        buf.write(binary_header(B_LIST, len(obj)))
+        for x in obj:
+            self.dump_rson(x, buf, transform)
+
+    def dump_stream(self, obj, buf, transform=None):
+        buf.write(bytes([B_STREAM]))
+        for x in obj:
+            self.dump_rson(x, buf, transform)
+        buf.write(bytes([B_END]))
+
+    def dump_set(self, obj, buf, transform=None):
+        buf.write(binary_header(B_SET, len(obj)))
+        for x in obj:
+            self.dump_rson(x, buf, transform)
+
+    def dump_record(self, obj, buf, transform=None):
+        buf.write(binary_header(B_RECORD, len(obj)))
+        dump_key, dump_rson = self.dump_key, self.dump_rson
+        for k, v in obj.items():
+            dump_key(k, buf, transform)
+            dump_rson(v, buf, transform)
+
+    def dump_dict(self, obj, buf, transform=None):
+        buf.write(binary_header(B_DICT, len(obj)))
+        for k in sorted(obj.keys()):
+            self.dump_key(k, buf, transform)
+            self.dump_rson(obj[k], buf, transform)
+
+    def dump_datetime(self, obj, buf, transform=None):
+        delta = obj.astimezone(timezone.utc) - epoch
+        buf.write(bytes([B_DATETIME]) + varint(zigzag(microseconds(delta))))
+
+    def dump_timedelta(self, obj, buf, transform=None):
+        buf.write(bytes([B_DURATION]) + varint(zigzag(microseconds(obj))))
+
+    def dump_tagged(self, obj, buf, transform=None):
+        name, value = self.object_to_tagged(obj)
+        if not isinstance(value, OrderedDict) and isinstance(value, dict):
+            value = OrderedDict(value)
+        self.dump_name(name, buf)
+        self.dump_rson(value, buf, transform)
+
+    def dump_slot(self, obj, buf, transform=None):
+        if buf.filling:
+            values, transform = buf.filling[-1]
+            self.dump_rson(values[obj.n], buf, transform)
+        else:
+            buf.marks.append((buf.tell(), obj.n))
+
+    def dump_filled(self, obj, buf, transform=None):
+        # interned strings are numbered in the order they are written,
+        # so the first use in a document is written out in full, and
+        # the template compiled against the strings it left behind
+        compiled = buf.templates.get(obj.template)
+        if compiled is None:
+            buf.filling.append((obj.values, transform))
+            self.dump_rson(obj.template.value, buf)
+            buf.filling.pop()
+            scratch = BinaryBuffer()
+            scratch.strings = dict(buf.strings)
+            buf.templates[obj.template] = self.compile(obj.template, scratch)
+            return
+        parts, last = compiled
+        values, dump_rson = obj.values, self.dump_rson
+        for part, n in parts:
+            buf.write(part)
+            dump_rson(values[n], buf, transform)
+        buf.write(last)
+
+class BinaryDecoder:
+    """push parser for one binary rson document, like Decoder
+
+    the document is read one token (a scalar, a tag, or the header of
+    a container) at a time, with open containers on an explicit stack,
+    so nothing is parsed twice however the input is split. each frame
+    is [out, name, kind, key, remaining, streamed]
+    """
+
+    def __init__(self, codec, transform=None, stream_key='items'):
+        self.codec = codec
+        self.transform = transform
+        self.stream_key = stream_key
+        self.buf = bytearray()
+        self.pos = 0
+        self.stack = []
+        self.strings = []
+        self.name = None
+        self.done = False
+        self.value = None
+
+    def feed(self, chunk):
+        # drop what has been parsed, once it is most of the buffer
+        if self.pos > 65536 and self.pos * 2 > len(self.buf):
+            del self.buf[:self.pos]
+            self.pos = 0
+        self.buf += chunk
+        return self.process()
+
+    def close(self):
+        items = self.process()
+        if not self.done:
+            raise ParserErr(self.buf, self.pos, "Unexpected end of input")
+        return items
+
+    def process(self):
+        items = []
+        buf, pos, end = self.buf, self.pos, len(self.buf)
+        stack, strings = self.stack, self.strings
+        transform = self.transform
+        tagged_to_object = self.codec.tagged_to_object
+
+        while not self.done and pos < end:
+            start = pos
+            try:
+                t = buf[pos]
+                pos += 1
+                if t == B_STRING or t == B_INTERN:
+                    n, pos = read_varint(buf, pos)
+                    if pos + n > end:
+                        raise Incomplete()
+                    try:
+                        value = buf[pos:pos + n].decode('utf-8')
+                    except UnicodeDecodeError:
+                        raise ParserErr(buf, start, "Invalid utf-8 in string")
+                    pos += n
+                    if t == B_INTERN:
+                        strings.append(value)
+                elif t == B_STRING_REF:
+                    n, pos = read_varint(buf, pos)
+                    if n >= len(strings):
+                        raise ParserErr(buf, start, "Unknown string reference {}".format(n))
+                    value = strings[n]
+                elif t == B_INT:
+                    n, pos = read_varint(buf, pos)
+                    value = (n >> 1) ^ -(n & 1)
+                elif t == B_STREAM:
+                    count = None
+                elif t in binary_containers:
+                    count, pos = read_varint(buf, pos)
+                elif t == B_TAG:
+                    if self.name is not None:
+                        raise ParserErr(buf, start, "Cannot nest tags")
+                    t = buf[pos]
+                    n, pos = read_varint(buf, pos + 1)
+                    if t == B_STRING_REF:
+                        if n >= len(strings):
+                            raise ParserErr(buf, start, "Unknown string reference {}".format(n))
+                        name = strings[n]
+                    elif t == B_INTERN:
+                        if pos + n > end:
+                            raise Incomplete()
+                        try:
+                            name = buf[pos:pos + n].decode('utf-8')
+                        except UnicodeDecodeError:
+                            raise ParserErr(buf, start, "Invalid utf-8 in tag")
+                        pos += n
+                        strings.append(name)
+                    else:
+                        raise ParserErr(buf, start, "Expecting a tag name")
+                    if name in reserved_tags:
+                        raise ParserErr(buf, start, "Unexpected tag {}".format(name))
+                    self.name = name
+                    self.pos = pos
+                    continue
+                elif t == B_END:
+                    if not stack or stack[-1][4] is not None or stack[-1][3] is not _no_key:
+                        raise ParserErr(buf, start, "Unexpected end of stream")
+                    if self.name is not None:
+                        raise ParserErr(buf, start, "Expecting a value after a tag")
+                elif t == B_NULL:
+                    value = None
+                elif t == B_FALSE:
+                    value = False
+                elif t == B_TRUE:
+                    value = True
+                elif t == B_FLOAT:
+                    if pos + 8 > end:
+                        raise Incomplete()
+                    value = double.unpack_from(buf, pos)[0]
+                    pos += 8
+                elif t == B_COMPLEX:
+                    if pos + 16 > end:
+                        raise Incomplete()
+                    value = complex(*double_pair.unpack_from(buf, pos))
+                    pos += 16
+                elif t == B_BYTES:
+                    n, pos = read_varint(buf, pos)
+                    if pos + n > end:
+                        raise Incomplete()
+                    value = bytes(buf[pos:pos + n])
+                    pos += n
+                elif t == B_DATETIME or t == B_DURATION:
+                    n, pos = read_varint(buf, pos)
+                    value = timedelta(microseconds=(n >> 1) ^ -(n & 1))
+                    if t == B_DATETIME:
+                        value = epoch + value
+                else:
+                    raise ParserErr(buf, start, "Unknown type {:#x}".format(t))
+            except (Incomplete, IndexError):
+                # wait for the rest of the token
+                break
+
+            self.pos = pos
+            name = self.name
+            if name is not None:
+                self.name = None
+
+            if t == B_END:
+                frame = stack.pop()
+                out, name = frame[0], frame[1]
+                value = out if name is None else tagged_to_object(name, out)
+            elif t in binary_containers:
+                kind = binary_containers[t]
+                out = set() if kind is _set else [] if kind is _list else OrderedDict()
+                if count or count is None:
+                    streamed = (kind is _list and self.stream_key is not None
+                        and len(stack) == 1 and stack[0][2] is _record
+                        and stack[0][3] == self.stream_key)
+                    stack.append([out, name, kind, _no_key, count, streamed])
+                    continue
+                value = out if name is None else tagged_to_object(name, out)
+            elif name is not None:
+                value = tagged_to_object(name, value)
+
+            if transform is not None:
+                value = transform(value)
+
+            # hand the finished value to the enclosing containers,
+            # closing each one that ends here
+            while True:
+                if not stack:
+                    self.value = value
+                    self.done = True
+                    break
+                frame = stack[-1]
+                out, kind = frame[0], frame[2]
+                if kind is _record:
+                    if frame[3] is _no_key:
+                        if value in out:
+                            raise SemanticErr('duplicate key: {}, {}'.format(value, out))
+                        frame[3] = value
+                        break
+                    out[frame[3]] = value
+                    frame[3] = _no_key
+                elif kind is _set:
+                    if value in out:
+                        raise SemanticErr('duplicate item in set: {}'.format(value))
+                    out.add(value)
+                elif frame[5]:
+                    items.append(value)
+                else:
+                    out.append(value)
+
+                if frame[4] is None:
+                    break
+                frame[4] -= 1
+                if frame[4]:
+                    break
+                stack.pop()
+                name = frame[1]
+                value = out if name is None else tagged_to_object(name, out)
+                if transform is not None:
+                    value = transform(value)
+
+        if self.done and self.pos < end:
+            raise ParserErr(buf, self.pos, "Trailing content: {}".format(
+                repr(bytes(buf[self.pos:self.pos + 10]))))
+        return items
+
 
 if __name__ == '__main__':
     codec = Codec(None, None)
@@ -698,6 +1805,107 @@ b"
     test_parse_err('"foo', ParserErr)
     test_parse_err('"\uD800\uDD01"', ParserErr)
     test_parse_err(r'"\uD800\uDD01"', ParserErr)
+    test_parse_err('[1,', ParserErr)
+    test_parse_err('{"a":1, "a":2}', SemanticErr)
+    test_parse_err('@set [1, 1]', SemanticErr)
+    test_parse_err('@object @object {}', ParserErr)
+    test_parse_err('{"a"}', ParserErr)
+    test_parse_err('[,]', ParserErr)
+
+    test_parse("{'a':1 , 'b' : [2 ,3 ] }", dict(a=1, b=[2, 3]))
+    test_parse("@float 1", 1.0)
+    test_parse("-1_000.5e1", -10005.0)
+
+    # parse_rson and parse_recursive must agree, down to transform order
+    def parse_both(buf):
+        seen = [[], []]
+        def record(n):
+            def transform(obj):
+                seen[n].append(repr(obj))
+                return obj
+            return transform
+        out = [None, None]
+        for n, fn in enumerate((codec.parse_rson, codec.parse_recursive)):
+            try:
+                out[n] = fn(buf, 0, record(n))
+            except Exception as e:
+                out[n] = (e.__class__, getattr(e, 'pos', None))
+        if repr(out[0]) != repr(out[1]) or seen[0] != seen[1]:
+            raise AssertionError('{}: {} != {}'.format(repr(buf), out[0], out[1]))
+
+    for buf in [
+            "@object null", "@bool true", "false", "0", "@float 0.0", "-0.0",
+            r'"test-\x32-\u0032-\U00000032"', r"'test \" \''", "[]", "[1,]",
+            '{"a":"b",}', "_1", "0b0123", "0o999", "0xGHij", "@set {}",
+            "@dict []", "[,]", '{"a"}', "@object @object {}", "[1 x]",
+            '{"a": [1, {"b": @set [2, 3]}], "c": @dict {"d": @complex [1, 2]}}',
+            "[1, # comment\n 2]", '{"a" 1}', "@int 1.5", "@list 'x'"]:
+        parse_both(buf)
+
+    depth = 100000
+    out = parse('[' * depth + ']' * depth)
+    for _ in range(depth - 1):
+        out = out[0]
+    if out != []:
+        raise AssertionError('deep nesting')
+
+    # dump_str must match the original character at a time escaping
+    def dump_str_reference(obj):
+        buf = io.StringIO()
+        buf.write('"')
+        for c in obj:
+            if c in escaped:
+                buf.write(escaped[c])
+            elif ord(c) < 0x20:
+                buf.write('\\x{:02X}'.format(ord(c)))
+            else:
+                buf.write(c)
+        buf.write('"')
+        return buf.getvalue()
+
+    import random
+    rand = random.Random(0)
+    alphabet = [chr(n) for n in range(0x80)] + ['\u00E9', '\u2028', '\uFEFF', '\U0001F600', '\uD800']
+    for n in range(2000):
+        obj = ''.join(rand.choice(alphabet) for _ in range(rand.randrange(40)))
+        out = dump(obj)
+        if out != dump_str_reference(obj):
+            raise AssertionError('{!r} != {!r}'.format(out, dump_str_reference(obj)))
+        if '\uD800' not in obj and parse(out) != obj:
+            raise AssertionError('{!r} did not round trip'.format(obj))
+
+    def test_decoder(buf, items, value, chunk_size):
+        decoder = Codec(None, lambda name, value: (name, value)).decoder()
+        data = buf.encode('utf-8')
+        out = []
+        for n in range(0, len(data), chunk_size):
+            out.extend(decoder.feed(data[n:n + chunk_size]))
+        out.extend(decoder.close())
+        if out != items or decoder.value != value:
+            raise AssertionError('{} != {}, {} != {}'.format(out, items, decoder.value, value))
+
+    def test_decoder_err(buf, exc):
+        decoder = codec.decoder()
+        try:
+            decoder.feed(buf.encode('utf-8'))
+            decoder.close()
+        except exc:
+            return
+        raise AssertionError('{} did not cause {}'.format(buf, exc))
+
+    cursor = '{"kind": "x", "items": [1, 23, "é\\n", [4, 5], {"a": 6}, 7.5], # comment\n "next": 12}'
+    for chunk_size in (1, 2, 3, 7, 1000):
+        test_decoder(cursor, [1, 23, "é\n", [4, 5], {"a": 6}, 7.5], {"kind": "x", "items": [], "next": 12}, chunk_size)
+        test_decoder('@object {"items": [], }', [], {"items": []}, chunk_size)
+        test_decoder('@Cursor {"items": [@Item 1]}', [('Item', 1)], ('Cursor', {"items": []}), chunk_size)
+        test_decoder('[1, 2, 3]', [], [1, 2, 3], chunk_size)
+        test_decoder('@set [1]', [], set([1]), chunk_size)
+        test_decoder('12345', [], 12345, chunk_size)
+
+    test_decoder_err('{"items": [1, 2', ParserErr)
+    test_decoder_err('{"items": [1, 2 3]}', ParserErr)
+    test_decoder_err('{"items": [], "items": 1}', SemanticErr)
+    test_decoder_err('{"a": 1} 2', ParserErr)
 
     tests = [
         0, -1, +1,
@@ -711,8 +1919,15 @@ b"
         timedelta(seconds=666),
     ]
 
+    tests.append([[x for x in tests if x == x], {"nested": [list(range(100)), "x" * 100]}])
+
     for obj in tests:
         buf0 = dump(obj)
+        for chunk_size in (1, 7, 64, 4096):
+            chunks = list(codec.dump_iter(obj, chunk_size=chunk_size))
+            if ''.join(chunks) != buf0 or any(len(c) > chunk_size for c in chunks):
+                raise AssertionError('dump_iter mismatch: {}'.format(chunks))
+
         obj1 = parse(buf0)
         buf1 = dump(obj1)
 
@@ -732,6 +1947,71 @@ b"
                 raise AssertionError(
                     'failed second trip {} != {}'.format(obj, out))
 
+    binary = BinaryCodec(lambda obj: ('Pair', list(obj)), lambda name, value: (name, value))
+    tests.append([[x for x in tests if x == x], {1: "one", 2.5: None}, 'x' * 300])
+
+    for obj in tests:
+        buf0 = binary.dump(obj)
+        for chunk_size in (1, 7, 4096):
+            chunks = list(binary.dump_iter(obj, chunk_size=chunk_size))
+            if b''.join(chunks) != buf0 or any(len(c) > chunk_size for c in chunks):
+                raise AssertionError('binary dump_iter mismatch: {}'.format(chunks))
+        obj1 = binary.parse(buf0)
+        if obj == obj and obj != obj1:
+            raise AssertionError('binary failed trip {} != {}'.format(obj, obj1))
+        if binary.dump(obj1) != buf0:
+            raise AssertionError('binary mismatched output {} != {}'.format(obj, obj1))
+
+    cursor = OrderedDict(kind="x", items=[1, "two", {"kind": 3}, {"kind": 4}], next=None)
+    buf = binary.dump(cursor)
+    for chunk_size in (1, 2, 5, 1000):
+        decoder = binary.decoder()
+        out = []
+        for n in range(0, len(buf), chunk_size):
+            out.extend(decoder.feed(buf[n:n + chunk_size]))
+        out.extend(decoder.close())
+        if out != cursor['items'] or decoder.value != dict(cursor, items=[]):
+            raise AssertionError('binary decoder: {} {}'.format(out, decoder.value))
+
+    if binary.parse(binary.dump(complex(1, 2))) != 1 + 2j:
+        raise AssertionError('binary complex')
+    if binary.parse(binary.dump(12.5 + 3j, lambda x: x)) != 12.5 + 3j:
+        raise AssertionError('binary transform')
+    if binary.parse(binary.dump(range(2))) != ('Pair', [0, 1]):
+        raise AssertionError('binary tagged')
+
+    for buf, exc in ((buf[:-1], ParserErr), (buf + b'\x00', ParserErr), (b'\xff', ParserErr),
+            (bytes([B_SET, 2, B_INT, 2, B_INT, 2]), SemanticErr),
+            (bytes([B_STRING_REF, 0]), ParserErr)):
+        try:
+            binary.parse(buf)
+        except exc:
+            continue
+        raise AssertionError('{} did not cause {}'.format(buf, exc))
+
+    for c in (codec, binary):
+        chunks = list(c.dump_iter(OrderedDict(kind='x', items=(n for n in range(3))), chunk_size=4096))
+        if len(chunks) != 5:
+            raise AssertionError('generator items were not flushed: {}'.format(chunks))
+        decoder = c.decoder()
+        chunks = [chunk.encode('utf-8') if isinstance(chunk, str) else chunk for chunk in chunks]
+        items = [x for chunk in chunks for x in decoder.feed(chunk)] + decoder.close()
+        if items != [0, 1, 2] or decoder.value != {'kind': 'x', 'items': []}:
+            raise AssertionError('generator: {} {}'.format(items, decoder.value))
+        if c.parse(c.dump([n for n in range(3)])) != c.parse(c.dump(n for n in range(3))):
+            raise AssertionError('generator dump')
+
+    template = Template(OrderedDict(kind='job', id=Slot(0), links=['a', 'b'], attributes=Slot(1)))
+    plain = [OrderedDict(kind='job', id=n, links=['a', 'b'], attributes={'n': n, 's': [n]})
+        for n in range(20)]
+    filled = [template.fill(n, {'n': n, 's': [n]}) for n in range(20)]
+    for c in (codec, binary):
+        if c.dump(filled) != c.dump(plain) or c.dump(filled[0]) != c.dump(plain[0]):
+            raise AssertionError('template: {}'.format(c.dump(filled)))
+        dumped = c.dump(OrderedDict(items=plain))
+        if dumped[:0].join(c.dump_iter(OrderedDict(items=filled), chunk_size=64)) != dumped:
+            raise AssertionError('template dump_iter')
+
     print('tests passed')
 
 
@@ -3,46 +3,119 @@ a http server that routes requests to the
 mapped objects, handling transforming them
 into rson wire objects
 """
+import io
+import asyncio
+import contextvars
+import hashlib
+import bisect
+import collections
+import heapq
+import operator
 import threading
+import itertools
 import types
 import socket
 import traceback
 import sys
 import inspect
+import time
 import uuid
+import zlib
 
 from urllib.parse import urljoin, urlencode
-from wsgiref.simple_server import make_server, WSGIRequestHandler
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref.simple_server import make_server, WSGIServer, WSGIRequestHandler, ServerHandler
 
 from werkzeug.utils import redirect as Redirect
 from werkzeug.wrappers import Request, Response
-from werkzeug.exceptions import HTTPException
+from werkzeug.exceptions import HTTPException, BadRequest, RequestEntityTooLarge
+from werkzeug.wsgi import LimitedStream
 
 from . import dom
 
+COMPRESS_MIN_SIZE=1024
+# the most a compressed request body may expand to
+MAX_BODY_SIZE=64*1024*1024
+
+# Content-Encoding -> zlib wbits
+compressions = {'gzip': 31, 'deflate': 15}
+
+# false while a server that handles one request at a time is handling
+# one: nothing can change while it waits, and everyone else waits too,
+# so long polls and watches return at once rather than hold it up
+concurrent_requests = contextvars.ContextVar('concurrent_requests', default=True)
+
+def float_param(params, name, default):
+    try:
+        return float(params.get(name, default))
+    except (TypeError, ValueError):
+        raise BadRequest('{} is not a number'.format(name)) from None
+
+def version_of(obj):
+    """ the version an object gives with a _version attribute or method,
+    or None. a GET of an object with a version is answered with an ETag
+    made from it, and not encoded at all when the client has it already """
+    if isinstance(obj, Projection):
+        obj = obj.obj
+    if isinstance(obj, type):
+        return None
+    version = getattr(obj, '_version', None)
+    if callable(version):
+        version = version()
+    return version
+
+def make_etag(*parts):
+    h = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode('utf-8')
+        h.update(part)
+        h.update(b'\0')
+    return h.hexdigest()
+
+def not_modified(etag):
+    response = Response(status=304)
+    response.set_etag(etag, weak=True)
+    return response
+
 def funcargs(m):
     args =  m.__code__.co_varnames[:m.__code__.co_argcount]
     args = [a for a in args if not a.startswith('_')]
     if args and args[0] == 'self': args.pop(0)
     return args
 
+def takes_keyword(fn, name):
+    """ whether fn can be called with the keyword argument name, which
+    handlers written before it was added may not take """
+    try:
+        parameters = inspect.signature(fn).parameters
+    except (TypeError, ValueError):
+        return False
+    return name in parameters or any(p.kind == p.VAR_KEYWORD for p in parameters.values())
+
+# class -> dom.Template of its resources, for make_resource
+resource_templates = {}
+
 def make_resource(obj, url):
     cls = obj.__class__
 
-    links, actions = extract_actions(cls)
-    attributes = extract_attributes(obj)
+    template = resource_templates.get(cls)
+    if template is None:
+        links, actions = extract_actions(cls)
 
-    metadata = dict(
-        url = url,
-        links = links,
-        actions = actions,
-    )
+        metadata = dict(
+            url = dom.Slot(0),
+            links = links,
+            actions = actions,
+        )
 
-    return dom.Resource(
-        kind = cls.__name__,
-        metadata = metadata,
-        attributes = attributes,
-    )
+        template = resource_templates[cls] = dom.Template(dom.Resource(
+            kind = cls.__name__,
+            metadata = metadata,
+            attributes = dom.Slot(1),
+        ))
+
+    return template.fill(url, extract_attributes(obj))
 
 def extract_actions(cls):
     links = []
@@ -90,12 +163,258 @@ def waiter():
     return _fn
 
 
+async def resolve(out):
+    """ awaits out, and whatever it returns, until it isn't awaitable """
+    while inspect.isawaitable(out):
+        out = await out
+    return out
+
 class Embed:
     pass
 
+class Projection:
+    """ an object to be sent with only some of its attributes """
+    __slots__ = ('obj', 'fields')
+
+    def __init__(self, obj, fields):
+        self.obj = obj
+        self.fields = fields
+
+def parse_fields(params):
+    """ the fields asked for with ?fields=a,b, or None for all of them """
+    fields = params.get('fields')
+    if not fields:
+        return None
+    return [f for f in fields.split(',') if f]
+
 class Nesting:
     pass
 
+def selector_matches(selector, attributes):
+    """ true if the attributes satisfy every dom.Operator in selector """
+    if not selector:
+        return True
+    for s in selector:
+        op = s.__class__
+        if op is dom.Operator.All:
+            continue
+        present = s.key in attributes
+        if op is dom.Operator.Exists:
+            match = present
+        elif op is dom.Operator.NotExists:
+            match = not present
+        elif not present:
+            match = False
+        else:
+            value = attributes[s.key]
+            try:
+                if op is dom.Operator.Equals:
+                    match = value == s.value
+                elif op is dom.Operator.NotEquals:
+                    match = value != s.value
+                elif op is dom.Operator.LessThan:
+                    match = value < s.value
+                elif op is dom.Operator.GreaterThan:
+                    match = value > s.value
+                elif op is dom.Operator.LessEqualTo:
+                    match = value <= s.value
+                elif op is dom.Operator.GreaterEqualTo:
+                    match = value >= s.value
+                elif op is dom.Operator.In:
+                    match = value in s.value
+                elif op is dom.Operator.NotIn:
+                    match = value not in s.value
+                else:
+                    raise dom.NotImplemented('unsupported selector: {}'.format(op.__name__))
+            except TypeError:
+                match = False
+        if not match:
+            return False
+    return True
+
+class HashIndex:
+    """ the keys of the objects with each value of an attribute, for
+    Equals and In. unhashable values are kept aside, and always returned
+    as candidates, to be checked against the selector """
+    def __init__(self):
+        self.keys = collections.defaultdict(set)
+        self.other = set()
+
+    def add(self, key, value):
+        try:
+            self.keys[value].add(key)
+        except TypeError:
+            self.other.add(key)
+
+    def remove(self, key, value):
+        try:
+            keys = self.keys.get(value)
+        except TypeError:
+            self.other.discard(key)
+            return
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.keys[value]
+
+    def select(self, op, value):
+        """ the candidate keys for an operator, or None if it can't help """
+        if op is dom.Operator.Equals:
+            values = (value,)
+        elif op is dom.Operator.In:
+            values = value
+        else:
+            return None
+        out = set(self.other)
+        for v in values:
+            try:
+                out.update(self.keys.get(v, ()))
+            except TypeError:
+                pass
+        return out
+
+class SortedIndex:
+    """ (value, key) pairs in order, for ranges. values that can't be
+    ordered against the rest are kept aside, as in HashIndex """
+    def __init__(self):
+        self.values = []
+        self.entries = []
+        self.other = set()
+
+    def add(self, key, value):
+        try:
+            i = bisect.bisect_left(self.entries, (value, key))
+        except TypeError:
+            self.other.add(key)
+            return
+        self.entries.insert(i, (value, key))
+        self.values.insert(i, value)
+
+    def remove(self, key, value):
+        try:
+            i = bisect.bisect_left(self.entries, (value, key))
+        except TypeError:
+            self.other.discard(key)
+            return
+        if i < len(self.entries) and self.entries[i] == (value, key):
+            del self.entries[i]
+            del self.values[i]
+
+    def select(self, op, value):
+        values = self.values
+        if op is dom.Operator.Equals:
+            bounds = [(value, bisect.bisect_left, value, bisect.bisect_right)]
+        elif op is dom.Operator.In:
+            bounds = [(v, bisect.bisect_left, v, bisect.bisect_right) for v in value]
+        elif op is dom.Operator.LessThan:
+            bounds = [(None, None, value, bisect.bisect_left)]
+        elif op is dom.Operator.LessEqualTo:
+            bounds = [(None, None, value, bisect.bisect_right)]
+        elif op is dom.Operator.GreaterThan:
+            bounds = [(value, bisect.bisect_right, None, None)]
+        elif op is dom.Operator.GreaterEqualTo:
+            bounds = [(value, bisect.bisect_left, None, None)]
+        else:
+            return None
+        out = set(self.other)
+        for low, lower, high, upper in bounds:
+            try:
+                lo = lower(values, low) if lower else 0
+                hi = upper(values, high) if upper else len(values)
+            except TypeError:
+                continue # no value in the index compares with it
+            out.update(key for value, key in self.entries[lo:hi])
+        return out
+
+class ChangeLog:
+    """ the last `size` changes to a collection, numbered in order, so
+    that watchers can pick up where they left off. tokens are only good
+    for the ChangeLog that made them.
+
+    changes are only kept while there are watchers, or have been in the
+    last keep_seconds, for them to come back for, so that a collection
+    nobody watches doesn't hold on to the objects it changed. when they
+    are not kept, they are still counted, and a token from before them
+    is Gone """
+    keep_seconds = 60
+
+    def __init__(self, size=10000):
+        self.changes = collections.deque(maxlen=size)
+        self.epoch = uuid.uuid4().hex[:12]
+        self.count = 0
+        self.condition = threading.Condition()
+        self.watchers = 0
+        self.last_watched = None
+
+    def watched(self):
+        if self.watchers:
+            return True
+        return self.last_watched is not None and time.monotonic() - self.last_watched < self.keep_seconds
+
+    def add(self, event, key, obj):
+        with self.condition:
+            self.count += 1
+            if not self.watched():
+                self.changes.clear()
+                return
+            self.changes.append((self.count, event, key, obj))
+            self.condition.notify_all()
+
+    def add_many(self, event, changes):
+        """ adds an event for each (key, obj) in changes, all at once """
+        with self.condition:
+            if not self.watched():
+                self.count += sum(1 for change in changes)
+                self.changes.clear()
+                return
+            for key, obj in changes:
+                self.count += 1
+                self.changes.append((self.count, event, key, obj))
+            self.condition.notify_all()
+
+    def token(self, n):
+        return "{}-{}".format(self.epoch, n)
+
+    def position(self, token):
+        """ the number of the last change seen by the holder of token,
+        or of the latest change, for no token """
+        with self.condition:
+            self.last_watched = time.monotonic()
+            if token is None:
+                return self.count
+            epoch, _, n = token.partition('-')
+            if epoch != self.epoch or not n.isdigit():
+                raise dom.Gone('unknown token: {}'.format(token))
+            n = int(n)
+            if n > self.count or n < self.count - len(self.changes):
+                raise dom.Gone('changes since {} are no longer kept'.format(token))
+            return n
+
+    def follow(self, n, timeout):
+        """ yields (number, event, key, obj) for each change after the
+        n-th, as they happen, until timeout seconds have passed """
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            self.watchers += 1
+        try:
+            while True:
+                with self.condition:
+                    while self.count == n:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            return
+                        self.condition.wait(remaining)
+                    start = n - (self.count - len(self.changes))
+                    if start < 0:
+                        return # fell behind: resuming from n will fail with Gone
+                    batch = list(itertools.islice(self.changes, start, None))
+                yield from batch
+                n = batch[-1][0]
+        finally:
+            with self.condition:
+                self.watchers -= 1
+                self.last_watched = time.monotonic()
+
 
 class RequestHandler:
     def subtypes(self):
@@ -116,17 +435,53 @@ class RequestHandler:
             return obj()
 
     def invoke_waiter(self, waiter, obj, params):
-        params = {key: dom.parse(value) for key,value in params.items()}
-        # if waiter is a fn
-        if obj is None:
-            out = waiter(**params)
-        else:
-            out = waiter(obj, **params)
+        """ calls the ready function of a waiter. if the client asks for a
+        long poll with _timeout, the function is called again (backing off)
+        until it returns something other than a Waiter, or time runs out """
+        polls = int(float_param(params, '_polls', 0))
+        timeout = min(float_param(params, '_timeout', 0), Waiter.long_poll_seconds)
+        if not concurrent_requests.get():
+            timeout = 0
+        params = {key: dom.parse(value) for key,value in params.items() if not key.startswith('_')}
+
+        def ready(args):
+            # if waiter is a fn
+            if obj is None:
+                return waiter(**args)
+            else:
+                return waiter(obj, **args)
+
+        out = ready(params)
+        if inspect.isawaitable(out):
+            return self.resolve_waiter(ready, out, polls, timeout)
+
+        deadline = time.monotonic() + timeout
+        delay = Waiter.min_wait_seconds
+        while isinstance(out, Waiter) and time.monotonic() + delay < deadline:
+            time.sleep(delay)
+            delay = min(delay * 2, Waiter.max_check_seconds)
+            out = ready(out.args)
 
         # if waiter is a waiter, call.resolve()
 
         if isinstance(out, Waiter):
             out.from_resolve = True
+            out.polls = polls + 1
+        return out
+
+    async def resolve_waiter(self, ready, out, polls, timeout):
+        """ invoke_waiter, for async ready functions """
+        out = await out
+        deadline = time.monotonic() + timeout
+        delay = Waiter.min_wait_seconds
+        while isinstance(out, Waiter) and time.monotonic() + delay < deadline:
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, Waiter.max_check_seconds)
+            out = await resolve(ready(out.args))
+
+        if isinstance(out, Waiter):
+            out.from_resolve = True
+            out.polls = polls + 1
         return out
 
 class NestedHandler(RequestHandler):
@@ -136,6 +491,7 @@ class NestedHandler(RequestHandler):
 
         self.for_path = {}
         self.for_type = {}
+        self.metadata_cache = {}
         self.add_nested_handlers()
 
     def add_nested_handlers(self):
@@ -172,7 +528,13 @@ class NestedHandler(RequestHandler):
     def handle_request(context, request):
         pass
 
+    def bind(self, context):
+        """ called on the way to a nested handler, to add any objects
+        it will need to the context """
+        pass
+
     def nested_request(self, subpath, context, request):
+        self.bind(context)
         return self.for_path[subpath].on_request(context, request)
 
     def add_nested_handler(self, name, cls, handler):
@@ -196,28 +558,86 @@ class NestedHandler(RequestHandler):
             return self.for_type[o.__self__].embed(sub_prefix, o)
         elif hasattr(o, '__class__') and o.__class__ in self.for_type:
             return self.for_type[o.__class__].embed(sub_prefix, o)
+        elif o.__class__ is Projection and o.obj.__class__ in self.for_type:
+            return self.for_type[o.obj.__class__].embed(sub_prefix, o)
         else:
             return self.handle_embed(prefix, o)
 
     def handle_embed(self, prefix, obj):
         pass
 
+    def embed_metadata(self, prefix):
+        """ the url, links, actions, and names of the nested handlers to
+        inline, for embed_namespace. these only depend on the class, so
+        they are worked out once for each prefix """
+        metadata = self.metadata_cache.get(prefix)
+        if metadata is None:
+            sub_prefix = "{}/".format(self.url(prefix))
+            links, actions = extract_actions(self.cls)
+            inlines = []
+            for name, handler in self.for_path.items():
+                if name in links: continue
+                if name in actions: continue
+                if handler.inline(sub_prefix): inlines.append(name)
+                links.append(name)
+            metadata = (self.url(prefix), sub_prefix, links, actions, inlines)
+            self.metadata_cache[prefix] = metadata
+        return metadata
+
+    def embed_namespace(self, prefix, attributes):
+        url, sub_prefix, links, actions, inlines = self.embed_metadata(prefix)
+        embeds = {}
+        for name in inlines:
+            inline = self.for_path[name].inline(sub_prefix)
+            if inline: embeds[name] = inline
+
+        metadata = dict(
+            url = url,
+            links = links,
+            actions = actions,
+            embeds = embeds,
+        )
+
+        return dom.Namespace(
+            kind = self.cls.__name__,
+            metadata = metadata,
+            attributes = attributes,
+        )
+
     
 class Waiter(Embed):
+    """ returned in place of a result that isn't ready yet. clients
+    poll its url, waiting wait_seconds between each one, which doubles
+    from min_wait_seconds up to max_wait_seconds. or, when the server
+    handles requests concurrently, they long poll, and the server waits
+    up to long_poll_seconds for the result instead, checking at most
+    max_check_seconds apart """
     suffix = '/wait'
+    min_wait_seconds = 0.05
+    max_wait_seconds = 2
+    long_poll_seconds = 30
+    max_check_seconds = 0.25
 
     def __init__(self, **args):
         self.args = args
         self.from_resolve = False
+        self.polls = 0
+
+    def wait_seconds(self):
+        return min(self.min_wait_seconds * 2 ** min(self.polls, 32), self.max_wait_seconds)
 
     def embed(self, prefix, name):
         params = {key: dom.dump(value) for key, value in self.args.items()}
+        if self.polls:
+            params['_polls'] = self.polls
         if not self.from_resolve:
             name = "{}{}".format(name,self.suffix) 
         url = "{}{}?{}".format(prefix, name,urlencode(params))
         metadata = dict()
         metadata["url"] = url
-        metadata["wait_seconds"] = 2
+        metadata["wait_seconds"] = self.wait_seconds()
+        if concurrent_requests.get():
+            metadata["long_poll_seconds"] = self.long_poll_seconds
         return dom.Waiter(
             metadata = metadata,
         )
@@ -274,7 +694,7 @@ class MethodHandler(RequestHandler):
         path = path[len(self.name)+1:]
         if path == 'wait':
             if method == 'GET':
-                return self.invoke_waiter(fn.waiter, None, params)
+                return self.invoke_waiter(fn.waiter, obj, params)
             else:
                 return MethodNotAllowed()
         elif path:
@@ -312,7 +732,7 @@ class Namespace:
                     handler = method.Handler(name, method)
                     self.add_nested_handler(name, method, handler)
                 elif isinstance(method, types.FunctionType):
-                    handler = FunctionHandler(self.name, method)
+                    handler = FunctionHandler(name, method)
                     self.add_nested_handler(name, method, handler)
 
         def subpath(self, path):
@@ -324,9 +744,8 @@ class Namespace:
             else:
                 raise dom.MethodNotAllowed()
         
-        def nested_request(self, path, context, request):
+        def bind(self, context):
             context[self.name] = self.obj
-            return NestedHandler.nested_request(self, path, context, request)
 
         def url(self, prefix):
             return prefix + self.name
@@ -338,34 +757,12 @@ class Namespace:
             return self.handle_embed(prefix, self.obj)
 
         def handle_embed(self,prefix, o):
-            sub_prefix = "{}/".format(self.url(prefix))
             if o is None or o is self.cls:
                 return self.link(prefix)
             elif not o is self.obj:
                 raise Exception('bad handler')
 
-            links, actions = extract_actions(self.cls)
-            attributes = extract_attributes(self.obj)
-            embeds = {}
-            for name, handler in self.for_path.items():
-                if name in links: continue
-                if name in actions: continue
-                inline = handler.inline(sub_prefix)
-                if inline: embeds[name] = inline
-                links.append(name)
-
-            metadata = dict(
-                url = self.url(prefix),
-                links = links,
-                actions = actions,
-                embeds = embeds,
-            )
-
-            return dom.Namespace(
-                kind = self.cls.__name__,
-                metadata = metadata,
-                attributes = attributes,
-            )
+            return self.embed_namespace(prefix, extract_attributes(self.obj))
 
 class Service:
     rpc = True
@@ -404,32 +801,10 @@ class Service:
             return self.handle_embed(prefix, self.cls())
 
         def handle_embed(self,prefix, o):
-            sub_prefix = "{}/".format(self.url(prefix))
             if o is None or o is self.cls:
                 return self.link(prefix)
 
-            links, actions = extract_actions(self.cls)
-            attributes = {}
-            embeds = {}
-            for name, handler in self.for_path.items():
-                if name in links: continue
-                if name in actions: continue
-                inline = handler.inline(sub_prefix)
-                if inline: embeds[name] = inline
-                links.append(name)
-
-            metadata = dict(
-                url = self.url(prefix),
-                links = links,
-                actions = actions,
-                embeds = embeds,
-            )
-
-            return dom.Namespace(
-                kind = self.cls.__name__,
-                metadata = metadata,
-                attributes = attributes,
-            )
+            return self.embed_namespace(prefix, {})
 
 class Singleton:
     rpc = True
@@ -457,9 +832,8 @@ class Singleton:
             else:
                 raise dom.MethodNotAllowed()
         
-        def nested_request(self, path, context, request):
+        def bind(self, context):
             context[self.name] = self.obj
-            return NestedHandler.nested_request(self, path, context, request)
 
         def url(self, prefix):
             return prefix + self.name
@@ -471,34 +845,12 @@ class Singleton:
             return self.handle_embed(prefix, self.obj)
 
         def handle_embed(self,prefix, o):
-            sub_prefix = "{}/".format(self.url(prefix))
             if o is None or o is self.cls:
                 return self.link(prefix)
             elif not o is self.obj:
                 raise Exception('bad handler')
 
-            links, actions = extract_actions(self.cls)
-            attributes = extract_attributes(self.obj)
-            embeds = {}
-            for name, handler in self.for_path.items():
-                if name in links: continue
-                if name in actions: continue
-                inline = handler.inline(sub_prefix)
-                if inline: embeds[name] = inline
-                links.append(name)
-
-            metadata = dict(
-                url = self.url(prefix),
-                links = links,
-                actions = actions,
-                embeds = embeds,
-            )
-
-            return dom.Namespace(
-                kind = self.cls.__name__,
-                metadata = metadata,
-                attributes = attributes,
-            )
+            return self.embed_namespace(prefix, extract_attributes(self.obj))
 
 class Token:
     rpc = True
@@ -564,59 +916,393 @@ class Token:
 class Collection:
     class List(Embed):
         suffix = '/list'
-        def __init__(self, name, items, selector, next):
+        def __init__(self, name, items, selector, next, fields=None):
             self.name = name
             self.items = items
             self.selector = selector
             self.next = next
+            self.fields = fields
 
         def embed(self, prefix, name):
             metadata = dict()
             metadata["collection"] = "{}{}{}".format(prefix, self.name, self.suffix)
             metadata["selector"] = self.selector
             metadata["continue"] = self.next
+            items = self.items
+            if self.fields:
+                metadata["fields"] = self.fields
+                items = [Projection(o, self.fields) for o in items]
 
             return dom.Cursor(
                 kind = self.name,
-                items = self.items,
+                items = items,
                 metadata = metadata,
             )
+    class Watch(Embed):
+        suffix = '/watch'
+        stream = True # sent as it is made, not peeked at
+
+        def __init__(self, name, changes, selector, since=None):
+            self.name = name
+            self.changes = changes
+            self.selector = selector
+            self.since = since
+
+        def embed(self, prefix, name):
+            metadata = dict()
+            metadata["collection"] = "{}{}{}".format(prefix, self.name, self.suffix)
+            metadata["selector"] = self.selector
+            # where the watch started, to carry on from if nothing changed
+            metadata["since"] = self.since
+
+            return dom.Cursor(
+                kind = self.name,
+                items = self.changes,
+                metadata = metadata,
+            )
+
     def dict_handler(name, d=None):
         if d is None:
             d = dict()
         class Handler(Collection.Handler):
             items = d
             key = name
+            sorted_keys = None # the keys in order, from the first page asked for
 
             def key_for(self, obj):
                 return getattr(obj, self.key)
 
-            def lookup(self, name):
-                return self.items[name]
+            def keys_in_order(self):
+                """ the keys of items in order, kept up to date as items are
+                added and removed here, and sorted again if items changes
+                size behind the handler's back. None if they don't sort """
+                keys = self.sorted_keys
+                if keys is None or len(keys) != len(self.items):
+                    try:
+                        keys = sorted(self.items)
+                    except TypeError:
+                        keys = None
+                    self.sorted_keys = keys
+                return keys
+
+            def key_added(self, key):
+                keys = self.sorted_keys
+                if keys is not None:
+                    try:
+                        i = bisect.bisect_left(keys, key)
+                    except TypeError:
+                        self.sorted_keys = None
+                        return
+                    if i == len(keys) or keys[i] != key:
+                        keys.insert(i, key)
+
+            def key_removed(self, key):
+                keys = self.sorted_keys
+                if keys is not None:
+                    try:
+                        i = bisect.bisect_left(keys, key)
+                    except TypeError:
+                        self.sorted_keys = None
+                        return
+                    if i < len(keys) and keys[i] == key:
+                        del keys[i]
+
+            def lookup(self, name, fields=None):
+                obj = self.items.get(name)
+                if obj is None:
+                    raise dom.NotFound(name)
+                return obj
 
             def create(self, data):
                 name = data[self.key]
                 j = self.items[name] = self.cls(**data)
+                self.key_added(name)
                 return j
 
+            def create_many(self, records):
+                objs = [(data[self.key], self.cls(**data)) for data in records]
+                self.items.update(objs)
+                for key, obj in objs:
+                    self.key_added(key)
+                return [obj for key, obj in objs]
+
             def delete(self, name):
                 self.items.pop(name)
+                self.key_removed(name)
+
+            def delete_many(self, keys):
+                objs = []
+                for key in keys:
+                    obj = self.items.pop(key, None)
+                    if obj is not None:
+                        self.key_removed(key)
+                        objs.append(obj)
+                return objs
+
+            def delete_list(self, selector):
+                deleted = []
+                for key, obj in list(self.items.items()):
+                    if selector_matches(selector, self.extract_attributes(obj)):
+                        if self.items.pop(key, None) is not None:
+                            self.key_removed(key)
+                            deleted.append((key, obj))
+                return deleted
+
+            def selector_args(self):
+                return self.create_args()
+
+            def list(self, selector, limit, next, order=None, fields=None):
+                if order:
+                    raise BadRequest('cannot order a dict collection')
+                if limit or next:
+                    out = self.page_in_order(selector, limit, next)
+                    if out is not None:
+                        return out
+                # a copy, so the dict can change while the page is made
+                return self.page(list(self.items.items()), selector, limit, next)
+
+            def page_in_order(self, selector, limit, next):
+                """ the List of a page of items, found by seeking to the
+                continuation in the keys in order, and reading on from
+                there, limit keys at a time, until the page is full.
+                None if the keys don't sort """
+                keys = self.keys_in_order()
+                if keys is None:
+                    return None
+                start = 0
+                if next:
+                    try:
+                        start = bisect.bisect_right(keys, dom.parse(next))
+                    except TypeError:
+                        return None
+
+                items = []
+                while True:
+                    # a slice, so keys can change between them; each one
+                    # starts after the last key read
+                    chunk = keys[start:start+limit] if limit else keys[start:]
+                    for key in chunk:
+                        obj = self.items.get(key)
+                        if obj is None:
+                            continue
+                        if selector and not selector_matches(selector, self.extract_attributes(obj)):
+                            continue
+                        items.append((key, obj))
+                        if len(items) == limit:
+                            break
+                    if not limit or not chunk or len(items) == limit:
+                        break
+                    start = bisect.bisect_right(keys, chunk[-1])
+
+                next_token = None
+                if limit and len(items) == limit:
+                    next_token = dom.dump(items[-1][0])
+                return Collection.List(
+                    name=self.name,
+                    items=[obj for key, obj in items],
+                    selector=dom.dump_selector(selector),
+                    next=next_token,
+                )
+
+            def page(self, items, selector, limit, next):
+                """ the List of the (key, obj) pairs in items that match
+                the selector, a page at a time if asked """
+                next_token = None
+
+                if limit or next:
+                    # pages are in key order, and continue from the last
+                    # key sent, which keeps its place as others come and go
+                    if next:
+                        after = dom.parse(next)
+                        items = [i for i in items if i[0] > after]
+                    if selector:
+                        items = [i for i in items if selector_matches(selector, self.extract_attributes(i[1]))]
+                    if limit:
+                        items = heapq.nsmallest(limit, items, key=operator.itemgetter(0))
+                        if len(items) == limit:
+                            next_token = dom.dump(items[-1][0])
+                    else:
+                        items.sort(key=operator.itemgetter(0))
+                elif selector:
+                    items = [i for i in items if selector_matches(selector, self.extract_attributes(i[1]))]
 
-            def list(self, selector, limit, next):
                 return Collection.List(
                     name=self.name, 
-                    items=list(self.items.values()),
-                    selector=selector,
-                    next=None,
+                    items=[obj for key, obj in items],
+                    selector=dom.dump_selector(selector),
+                    next=next_token,
                 )
 
 
         return Handler
 
+    def indexed_handler(name, d=None, hashed=(), ordered=()):
+        """ a dict_handler that indexes the attributes in hashed (for
+        Equals and In), and in ordered (for those and ranges), so that
+        lists with selectors on them only look at the objects that match.
+
+        the indexes are kept up to date by the handler, as objects are
+        created, deleted, or have methods called on them """
+        class Handler(Collection.dict_handler(name, d)):
+            def __init__(self, name, cls):
+                Collection.Handler.__init__(self, name, cls)
+                self.lock = threading.Lock()
+                self.indexes = {}
+                for attr in hashed:
+                    self.indexes.setdefault(attr, []).append(HashIndex())
+                for attr in ordered:
+                    self.indexes.setdefault(attr, []).append(SortedIndex())
+                self.indexed = {}
+                for key, obj in list(self.items.items()):
+                    self.index(key, obj)
+
+            def index(self, key, obj):
+                attributes = self.extract_attributes(obj)
+                values = {}
+                for attr, indexes in self.indexes.items():
+                    if attr in attributes:
+                        values[attr] = value = attributes[attr]
+                        for i in indexes:
+                            i.add(key, value)
+                self.indexed[key] = values
+
+            def unindex(self, key):
+                for attr, value in self.indexed.pop(key, {}).items():
+                    for i in self.indexes[attr]:
+                        i.remove(key, value)
+
+            def create(self, data):
+                with self.lock:
+                    name = data[self.key]
+                    self.unindex(name)
+                    obj = self.items[name] = self.cls(**data)
+                    self.index(name, obj)
+                    self.key_added(name)
+                return obj
+
+            def create_many(self, records):
+                objs = [(data[self.key], self.cls(**data)) for data in records]
+                with self.lock:
+                    for name, obj in objs:
+                        self.unindex(name)
+                        self.items[name] = obj
+                        self.index(name, obj)
+                        self.key_added(name)
+                return [obj for key, obj in objs]
+
+            def delete(self, name):
+                with self.lock:
+                    self.items.pop(name)
+                    self.unindex(name)
+                    self.key_removed(name)
+
+            def delete_many(self, keys):
+                objs = []
+                with self.lock:
+                    for key in keys:
+                        obj = self.items.pop(key, None)
+                        if obj is not None:
+                            self.unindex(key)
+                            self.key_removed(key)
+                            objs.append(obj)
+                return objs
+
+            def delete_list(self, selector):
+                deleted = []
+                for obj in self.list(selector, None, None).items:
+                    key = self.key_for(obj)
+                    with self.lock:
+                        if self.items.get(key) is obj:
+                            self.items.pop(key)
+                            self.unindex(key)
+                            self.key_removed(key)
+                            deleted.append((key, obj))
+                return deleted
+
+            def update(self, obj):
+                key = self.key_for(obj)
+                with self.lock:
+                    if self.items.get(key) is obj:
+                        self.unindex(key)
+                        self.index(key, obj)
+
+            def update_one(self, key, changes, selector):
+                with self.lock:
+                    obj = self.items.get(key)
+                    if obj is None:
+                        raise dom.NotFound(key)
+                    if not selector_matches(selector, self.extract_attributes(obj)):
+                        raise dom.PreconditionFailed()
+                    self.apply_changes(obj, changes)
+                    self.unindex(key)
+                    self.index(key, obj)
+                return obj
+
+            def update_list(self, selector, changes):
+                objs = []
+                for obj in self.list(selector, None, None).items:
+                    key = self.key_for(obj)
+                    with self.lock:
+                        if self.items.get(key) is obj:
+                            self.apply_changes(obj, changes)
+                            self.unindex(key)
+                            self.index(key, obj)
+                            objs.append(obj)
+                return objs
+
+            def candidates(self, selector):
+                """ the fewest keys an index can narrow the selector to,
+                or None if none of them can help """
+                best = None
+                for s in selector or ():
+                    for i in self.indexes.get(getattr(s, 'key', None), ()):
+                        keys = i.select(s.__class__, getattr(s, 'value', None))
+                        if keys is not None and (best is None or len(keys) < len(best)):
+                            best = keys
+                return best
+
+            def list(self, selector, limit, next, order=None, fields=None):
+                if order:
+                    raise BadRequest('cannot order a dict collection')
+                with self.lock:
+                    keys = self.candidates(selector)
+                    # reading on in key order finds a page of limit in
+                    # about limit * len(items) / len(keys) keys, which
+                    # can beat picking it out of every key that matched
+                    if keys is None and (limit or next) or \
+                            limit and limit * len(self.items) < len(keys) ** 2:
+                        out = self.page_in_order(selector, limit, next)
+                        if out is not None:
+                            return out
+                    if keys is None:
+                        items = list(self.items.items())
+                    else:
+                        items = [(k, self.items[k]) for k in keys if k in self.items]
+                if keys is not None and not limit and not next:
+                    items.sort(key=operator.itemgetter(0))
+                return self.page(items, selector, limit, next)
+
+        return Handler
+
     class Handler(RequestHandler):
+        watch_seconds = 30
+        max_watch_seconds = 300
+
         def __init__(self, name, cls):
             self.cls = cls
             self.name = name
+            self.changes = ChangeLog()
+            self.templates = {}
+
+        # the methods that handle {collection}/<col_method>/...
+        col_methods = {
+            '': 'on_collection',
+            'id': 'on_id',
+            'list': 'on_list',
+            'watch': 'on_watch',
+            'new': 'on_new',
+            'delete': 'on_delete',
+        }
 
         def on_request(self, context, request):
             method, path, params, data = request.method, request.url, request.params, request.data
@@ -625,76 +1311,183 @@ class Collection:
             if '/' in col_method:
                 col_method, path = col_method.split('/',1)
 
-            if col_method =='id':
-                if '/' in path:
-                    id, obj_method = path.split('/',1)
-                else:
-                    id, obj_method = path, None
+            name = self.col_methods.get(col_method)
+            if name is None:
+                raise dom.NotFound()
+            return getattr(self, name)(method, path, params, data)
 
-                if obj_method and obj_method.startswith('_'):
-                    raise dom.Forbidden()
-                
-                if not obj_method:
-                    if method == 'GET':
-                        return self.lookup(id)
-                    elif method == 'DELETE':
-                        self.delete(id)
-                        return None
-                    else:
-                        raise dom.MethodNotAllowed()
-                elif '/' in obj_method:
-                    obj_method, subpath = obj_method.split('/',1)
+        def on_collection(self, method, path, params, data):
+            if method != 'GET':
+                raise dom.MethodNotAllowed()
+            return self.cls
 
-                    obj = self.lookup(id)
-                    fn = getattr(obj, obj_method)
+        def on_id(self, method, path, params, data):
+            if '/' in path:
+                id, obj_method = path.split('/',1)
+            else:
+                id, obj_method = path, None
 
-                    if subpath == 'wait':
-                        if method != 'GET':
-                            raise MethodNotAllowed()
-                        return self.invoke_waiter(fn.waiter, obj,  params)
-                    else:
-                        raise dom.NotFound()
+            if obj_method and obj_method.startswith('_'):
+                raise dom.Forbidden()
+            
+            if not obj_method:
+                if method == 'GET':
+                    fields = parse_fields(params)
+                    if fields:
+                        if takes_keyword(self.lookup, 'fields'):
+                            obj = self.lookup(id, fields=fields)
+                        else:
+                            obj = self.lookup(id)
+                        self.check_fields([obj], fields)
+                        return Projection(obj, fields)
+                    return self.lookup(id)
+                elif method == 'DELETE':
+                    self.delete_one(id)
+                    return None
+                elif method == 'PATCH':
+                    # ?where= makes it conditional, on a version say
+                    selector = dom.parse_selector(params.get('where', None))
+                    obj = self.update_one(id, self.check_changes(data), selector)
+                    self.changes.add('update', self.key_for(obj), obj)
+                    return obj
                 else:
-                    obj = self.lookup(id)
-                    fn = getattr(obj, obj_method)
+                    raise dom.MethodNotAllowed()
+            elif '/' in obj_method:
+                obj_method, subpath = obj_method.split('/',1)
 
-                    if method == 'GET':
-                        return self.invoke(fn, params=params, safe=True)
-                    elif method == 'POST':
-                        return self.invoke(fn, data)
-                    else:
-                        raise dom.MethodNotAllowed()
+                obj = self.lookup(id)
+                fn = getattr(obj, obj_method)
+
+                if subpath == 'wait':
+                    if method != 'GET':
+                        raise MethodNotAllowed()
+                    return self.invoke_waiter(fn.waiter, obj,  params)
+                else:
+                    raise dom.NotFound()
+            else:
+                obj = self.lookup(id)
+                fn = getattr(obj, obj_method)
 
-            elif col_method =='list':
                 if method == 'GET':
-                    selector = params.get('where',None)
-                    limit = params.get('limit')
-                    next = params.get('continue')
-                    if limit:
-                        limit = int(limit)
-                    selector = dom.parse_selector(selector)
-                    return self.list(selector, limit, next)
-                elif method == 'DELETE':
-                    selector = params['where']
-                    selector = dom.parse_selector(selector)
-                    self.delete_list(selector)
-                    return
+                    return self.invoke(fn, params=params, safe=True)
+                elif method == 'POST':
+                    out = self.invoke(fn, data)
+                    self.update(obj)
+                    self.changes.add('update', self.key_for(obj), obj)
+                    return out
                 else:
                     raise dom.MethodNotAllowed()
-            elif col_method == 'new':
-                if method != 'POST':
-                    raise dom.MethodNotAllowed()
-                return self.create(data)
-            elif col_method == 'delete':
-                if method != 'POST':
-                    raise dom.MethodNotAllowed()
-                return self.delete(path)
-            elif col_method == '':
-                if method != 'GET':
-                    raise dom.MethodNotAllowed()
-                return self.cls
 
-            raise dom.NotImplelmented(method)
+        def on_list(self, method, path, params, data):
+            if method == 'GET':
+                selector = params.get('where',None)
+                limit = params.get('limit')
+                next = params.get('continue')
+                options = {}
+                if params.get('order'):
+                    if not takes_keyword(self.list, 'order'):
+                        raise BadRequest('cannot order {}'.format(self.name))
+                    options['order'] = params['order']
+                fields = parse_fields(params)
+                if fields and takes_keyword(self.list, 'fields'):
+                    options['fields'] = fields
+                if limit:
+                    limit = int(limit)
+                selector = dom.parse_selector(selector)
+                out = self.list(selector, limit, next, **options)
+                if fields:
+                    out.items = list(out.items)
+                    self.check_fields(out.items, fields)
+                out.fields = fields
+                return out
+            elif method == 'DELETE':
+                selector = params['where']
+                selector = dom.parse_selector(selector)
+                self.changes.add_many('delete', self.delete_list(selector) or ())
+                return
+            elif method == 'PATCH':
+                selector = params['where']
+                selector = dom.parse_selector(selector)
+                objs = self.update_list(selector, self.check_changes(data))
+                self.changes.add_many('update', [(self.key_for(obj), obj) for obj in objs])
+                return len(objs)
+            else:
+                raise dom.MethodNotAllowed()
+
+        def on_watch(self, method, path, params, data):
+            if method != 'GET':
+                raise dom.MethodNotAllowed()
+            selector = dom.parse_selector(params.get('where', None))
+            timeout = float_param(params, 'timeout', self.watch_seconds)
+            timeout = min(timeout, self.max_watch_seconds)
+            if not concurrent_requests.get():
+                timeout = 0 # just the changes so far
+            return self.watch(selector, params.get('since'), timeout)
+
+        def on_new(self, method, path, params, data):
+            """ creates an object from a dict, or one from each of a list
+            of them, returning the object, or how many were made """
+            if method != 'POST':
+                raise dom.MethodNotAllowed()
+            if isinstance(data, list):
+                if not all(isinstance(d, dict) for d in data):
+                    raise BadRequest('expected a list of records')
+                objs = self.create_many(data)
+                self.changes.add_many('create', [(self.key_for(obj), obj) for obj in objs])
+                return len(objs)
+            obj = self.create(data)
+            self.changes.add('create', self.key_for(obj), obj)
+            return obj
+
+        def on_delete(self, method, path, params, data):
+            """ deletes the object at delete/<key>, or those with each of a
+            list of keys, posted to delete """
+            if method != 'POST':
+                raise dom.MethodNotAllowed()
+            if path:
+                return self.delete_one(path)
+            if not isinstance(data, list):
+                raise BadRequest('expected a list of keys')
+            objs = self.delete_many(data)
+            self.changes.add_many('delete', [(self.key_for(obj), obj) for obj in objs])
+            return len(objs)
+
+        def check_changes(self, data):
+            if not isinstance(data, dict) or not data:
+                raise BadRequest('expected a dict of changes')
+            return data
+
+        def delete_one(self, key):
+            try:
+                obj = self.lookup(key)
+            except Exception:
+                obj = None
+            out = self.delete(key)
+            self.changes.add('delete', key, obj)
+            return out
+
+        def watch(self, selector, since, timeout):
+            """ a Watch of the changes after since (a token from an
+            earlier change), or from now on, that match selector """
+            start = self.changes.position(since)
+
+            def changes():
+                for n, event, key, obj in self.changes.follow(start, timeout):
+                    if obj is not None and not selector_matches(selector, self.extract_attributes(obj)):
+                        continue
+                    yield dom.Change(
+                        event=event,
+                        id=key,
+                        token=self.changes.token(n),
+                        item=obj if event != 'delete' else None,
+                    )
+
+            return Collection.Watch(
+                name=self.name,
+                changes=changes(),
+                selector=dom.dump_selector(selector),
+                since=self.changes.token(start),
+            )
 
         def url(self, prefix):
             return prefix+self.name
@@ -721,31 +1514,53 @@ class Collection:
             if o is None or o is self.cls:
                 return self.link(prefix)
 
-            url = self.url_for(prefix, o)
+            template = self.templates.get(prefix)
+            if template is None:
+                template = self.templates[prefix] = self.resource_template(prefix)
 
-            links, actions = self.extract_actions(self.cls)
+            if o.__class__ is Projection:
+                o, attributes = o.obj, self.extract_attributes(o.obj, o.fields)
+            else:
+                attributes = self.extract_attributes(o)
 
-            attributes = self.extract_attributes(o)
+            return template.fill(self.key_for(o), self.url_for(prefix, o), attributes)
+
+        def resource_template(self, prefix):
+            """ the parts of an embedded object that are the same for
+            every one, so they are encoded once, not once per object """
+            links, actions = self.extract_actions(self.cls)
 
             metadata = dict(
-                id = self.key_for(o),
+                id = dom.Slot(0),
                 collection = self.url(prefix),
-                url = url,
+                url = dom.Slot(1),
                 links = links,
                 actions = actions,
             )
 
-            return dom.Resource(
+            return dom.Template(dom.Resource(
                 kind = self.cls.__name__,
                 metadata = metadata,
-                attributes = attributes,
-            )
+                attributes = dom.Slot(2),
+            ))
 
         def extract_actions(self, obj):
             return extract_actions(obj)
 
-        def extract_attributes(self, obj):
-            return extract_attributes(obj)
+        def extract_attributes(self, obj, fields=None):
+            """ the attributes to send, or just those in fields """
+            attributes = extract_attributes(obj)
+            if fields is not None:
+                attributes = {k: attributes[k] for k in fields if k in attributes}
+            return attributes
+
+        def check_fields(self, objs, fields):
+            """ raises BadRequest for a field that one of objs doesn't have """
+            for obj in objs:
+                attributes = self.extract_attributes(obj)
+                for name in fields:
+                    if name not in attributes:
+                        raise BadRequest('unknown field: {}'.format(name))
 
         def url_for(self, prefix, o):
             return "{}{}/id/{}".format(prefix,self.name,self.key_for(o))
@@ -761,20 +1576,71 @@ class Collection:
         def create(self, data):
             raise Exception('unimplemented')
 
+        def create_many(self, records):
+            """ creates an object for each dict in records, returning them """
+            return [self.create(data) for data in records]
+
         def delete(self, name):
             raise Exception('unimplemented')
 
+        def delete_many(self, keys):
+            """ deletes the objects with keys, returning those there were """
+            objs = []
+            for key in keys:
+                try:
+                    obj = self.lookup(key)
+                except Exception:
+                    continue
+                self.delete(key)
+                objs.append(obj)
+            return objs
+
         def delete_list(self, selector):
+            """ deletes the objects that match selector. it may return the
+            (key, obj) of each, with obj None if it wasn't read, for
+            watchers to hear of; returning None tells them nothing """
             raise Exception('unimplemented')
 
+        def update(self, obj):
+            """ called after a method call on obj, which may have changed it """
+            pass
+
+        def update_one(self, key, changes, selector):
+            """ sets the attributes in changes on the object with key, if
+            it matches selector, returning it """
+            obj = self.lookup(key)
+            if not selector_matches(selector, self.extract_attributes(obj)):
+                raise dom.PreconditionFailed()
+            self.apply_changes(obj, changes)
+            self.update(obj)
+            return obj
+
+        def update_list(self, selector, changes):
+            """ sets the attributes in changes on every object that matches
+            selector, returning them """
+            objs = self.list(selector, None, None).items
+            for obj in objs:
+                self.apply_changes(obj, changes)
+                self.update(obj)
+            return objs
+
+        def apply_changes(self, obj, changes):
+            attributes = self.extract_attributes(obj)
+            for name in changes:
+                if name == self.key or name not in attributes:
+                    raise BadRequest('cannot update {}'.format(name))
+            for name, value in changes.items():
+                setattr(obj, name, value)
+
         def list(self, selector, limit, next):
             raise Exception('unimplemented')
 
-        def watch(self, selector):
-            raise Exception('unimplemented')
 
 class Model:
     class PeeweeHandler(Collection.Handler):
+        create_chunk_size = 1000 # rows inserted or deleted in a transaction
+        max_variables = 999 # parameters in a statement, sqlite's limit before 3.32
+
         def __init__(self, name, cls):
             self.pk = cls._meta.primary_key
             self.key = self.pk.name
@@ -791,9 +1657,9 @@ class Model:
         def selector_args(self):
             return self.indexes
 
-        def extract_attributes(self, obj):
+        def extract_attributes(self, obj, fields=None):
             attr = dict()
-            for name in self.fields:
+            for name in self.fields if fields is None else fields:
                 a = getattr(obj, name)
                 if isinstance(a, uuid.UUID):
                     a = a.hex
@@ -807,47 +1673,225 @@ class Model:
                 attr = attr.hex
             return attr
 
-        def lookup(self, name):
-            return self.cls.get(self.pk == name)
+        def lookup(self, name, fields=None):
+            try:
+                return self.select(fields).where(self.pk == name).get()
+            except self.cls.DoesNotExist:
+                raise dom.NotFound(name) from None
+
+        def check_fields(self, objs, fields):
+            for name in fields:
+                if name not in self.fields:
+                    raise BadRequest('unknown field: {}'.format(name))
+
+        def select(self, fields, *extra):
+            """ a select of just the columns for fields, and the primary key,
+            or of every column if fields is None """
+            if fields is None:
+                return self.cls.select()
+            for name in fields:
+                if name not in self.fields:
+                    raise BadRequest('unknown field: {}'.format(name))
+            names = [self.pk.name]
+            for name in itertools.chain(fields, extra):
+                if name not in names:
+                    names.append(name)
+            return self.cls.select(*(self.fields[name] for name in names))
 
         def create(self, data):
             return self.cls.create(**data)
 
+        def create_many(self, records):
+            """ inserts the records with insert_many, up to create_chunk_size
+            rows to a transaction, and as many rows to a statement as fit
+            in max_variables parameters
+
+            when the database makes up the keys, they are read back with
+            RETURNING, or without it, by inserting a row at a time """
+            objs = [self.cls(**data) for data in records]
+            if not objs:
+                return objs
+            names = set()
+            for obj in objs:
+                names.update(obj.__data__)
+            fields = [f for name, f in self.fields.items() if name in names]
+            rows = [tuple(obj.__data__.get(f.name) for f in fields) for obj in objs]
+
+            db = self.cls._meta.database
+            made_keys = any(obj.__data__.get(self.pk.name) is None for obj in objs)
+            if made_keys and not db.returning_clause:
+                per_insert = 1
+            else:
+                per_insert = max(1, self.max_variables // len(fields))
+            for start in range(0, len(rows), self.create_chunk_size):
+                chunk = rows[start:start+self.create_chunk_size]
+                with db.atomic():
+                    for n in range(0, len(chunk), per_insert):
+                        query = self.cls.insert_many(chunk[n:n+per_insert], fields=fields)
+                        batch = objs[start+n:start+n+per_insert]
+                        if not made_keys:
+                            query.execute()
+                        elif db.returning_clause:
+                            keys = query.returning(self.pk).tuples().execute()
+                            for obj, (key,) in zip(batch, keys):
+                                setattr(obj, self.pk.name, key)
+                        else:
+                            setattr(batch[0], self.pk.name, query.execute())
+            return objs
+
         def delete(self, name):
             self.cls.delete().where(self.pk == name).execute()
 
+        def check_changes(self, data):
+            data = Collection.Handler.check_changes(self, data)
+            for name in data:
+                if name not in self.fields or name == self.pk.name:
+                    raise BadRequest('cannot update {}'.format(name))
+            return data
+
+        def update_one(self, key, changes, selector):
+            """ one UPDATE ... WHERE pk = key, and the selector """
+            query = self.cls.update(**changes).where(self.pk == key)
+            if selector:
+                query = self.select_on(query, selector)
+            if not query.execute():
+                self.lookup(key)
+                raise dom.PreconditionFailed()
+            return self.lookup(key)
+
+        def update_list(self, selector, changes):
+            """ one UPDATE ... WHERE selector. the rows are read first, to
+            send on to watchers """
+            with self.cls._meta.database.atomic():
+                objs = list(self.select_on(self.cls.select(), selector or ()))
+                self.select_on(self.cls.update(**changes), selector or ()).execute()
+            for obj in objs:
+                for name, value in changes.items():
+                    setattr(obj, name, value)
+            return objs
+
+        def delete_many(self, keys):
+            objs = []
+            db = self.cls._meta.database
+            for start in range(0, len(keys), self.create_chunk_size):
+                chunk = keys[start:start+self.create_chunk_size]
+                with db.atomic():
+                    for n in range(0, len(chunk), self.max_variables):
+                        where = self.pk.in_(chunk[n:n+self.max_variables])
+                        objs.extend(self.cls.select().where(where))
+                        self.cls.delete().where(where).execute()
+            return objs
+
         def delete_list(self, selector):
-            self.select_on(self.cls.delete(), selector).execute()
+            """ one DELETE ... WHERE selector, after reading just the keys
+            of the rows, in the same transaction """
+            with self.cls._meta.database.atomic():
+                keys = [self.key_for(row) for row in self.select_on(self.cls.select(self.pk), selector or ())]
+                self.select_on(self.cls.delete(), selector or ()).execute()
+            return [(key, None) for key in keys]
 
         def select_on(self, items, selector):
+            """ adds a where clause for each operator in the selector.
+            a NULL column counts as missing for Exists and NotExists, and
+            as a value unequal to everything for NotEquals and NotIn """
             for s in selector:
-                key, operator, values = s.key, s.__class__, s.value
-                field = self.fields[key]
-                if operator == dom.Operator.Equals:
-                    items = items.where(field == values)
-                elif operator == dom.Operator.NotEquals:
-                    items = items.where(field != values)
+                op = s.__class__
+                if op is dom.Operator.All:
+                    continue
+                if s.key not in self.fields:
+                    raise BadRequest('cannot select on {}'.format(s.key))
+                field = self.fields[s.key]
+                if op is dom.Operator.Exists:
+                    items = items.where(field.is_null(False))
+                    continue
+                elif op is dom.Operator.NotExists:
+                    items = items.where(field.is_null())
+                    continue
+
+                value = s.value
+                if op is dom.Operator.Equals:
+                    clause = field == value
+                elif op is dom.Operator.NotEquals:
+                    clause = field != value
+                    if value is not None:
+                        clause = clause | field.is_null()
+                elif op is dom.Operator.LessThan:
+                    clause = field < value
+                elif op is dom.Operator.GreaterThan:
+                    clause = field > value
+                elif op is dom.Operator.LessEqualTo:
+                    clause = field <= value
+                elif op is dom.Operator.GreaterEqualTo:
+                    clause = field >= value
+                elif op is dom.Operator.In:
+                    clause = field.in_(list(value))
+                elif op is dom.Operator.NotIn:
+                    clause = field.not_in(list(value)) | field.is_null()
                 else:
-                    raise Exception('unsupported')
+                    raise dom.NotImplemented('unsupported selector: {}'.format(op.__name__))
+                items = items.where(clause)
             return items
 
-        def list(self, selector, limit, next):
-            items = self.cls.select()
+        def list(self, selector, limit, next, order=None, fields=None):
+            """ order is an indexed field, or -field for descending.
+            pages are found by seeking past the (field, key) of the last
+            row sent, which the continuation token holds along with the
+            order, so a deep page costs the same as the first """
             pk = self.pk
             next_token = None
+
+            after = None
+            if next:
+                try:
+                    after = dom.parse(next)
+                except Exception:
+                    after = None
+                if not isinstance(after, list) or len(after) not in (1, 3):
+                    raise BadRequest('bad continuation: {}'.format(next))
+                if order and order != after[0]:
+                    raise BadRequest('cannot change the order while listing')
+                order = after[0] if len(after) == 3 else None
+
+            field, descending = None, False
+            if order:
+                name, descending = order.lstrip('-'), order.startswith('-')
+                if name not in self.indexes:
+                    raise BadRequest('cannot order by {}'.format(name))
+                field = self.fields[name]
+                if field is pk:
+                    field = None
+
+            items = self.select(fields, *([field.name] if field is not None else []))
             if selector:
                 items = self.select_on(items, selector)
 
-            if limit or next:
-                items = items.order_by(pk)
-                if next:
-                    items = items.where(pk > next)
-                if limit:
-                    items = items.limit(limit)
-
-                items = list(items)
-                if items:
-                    next_token = self.key_for(items[-1])
+            if field is not None:
+                # nulls come before every value, and after them when descending
+                if descending:
+                    items = items.order_by(field.desc(nulls='last'), pk.desc())
+                else:
+                    items = items.order_by(field.asc(nulls='first'), pk.asc())
+                if after is not None:
+                    items = items.where(self.seek(field, descending, after[1], after[2]))
+            elif limit or next or order:
+                items = items.order_by(pk.desc() if descending else pk.asc())
+                if after is not None:
+                    key = after[-1]
+                    items = items.where(pk < key if descending else pk > key)
+
+            if limit:
+                items = list(items.limit(limit))
+                if len(items) == limit:
+                    last = items[-1]
+                    if field is not None:
+                        value = getattr(last, field.name)
+                        if isinstance(value, uuid.UUID):
+                            value = value.hex
+                        next_token = dom.dump([order, value, self.key_for(last)])
+                    elif order:
+                        next_token = dom.dump([order, None, self.key_for(last)])
+                    else:
+                        next_token = dom.dump([self.key_for(last)])
             else:
                 items = list(items)
 
@@ -858,11 +1902,36 @@ class Model:
                 next=next_token
             )
 
+        def seek(self, field, descending, value, key):
+            """ the where clause for the rows after (value, key) """
+            from peewee import Tuple
+            pk = self.pk
+            if value is None:
+                if descending:
+                    return field.is_null() & (pk < key)
+                return (field.is_null() & (pk > key)) | field.is_null(False)
+            if descending:
+                return (Tuple(field, pk) < Tuple(value, key)) | field.is_null()
+            return Tuple(field, pk) > Tuple(value, key)
+
+
 
+class Route:
+    """ a node in the route trie: the handler for a path segment, and
+    for a NestedHandler, the routes for the segments under it """
+    __slots__ = ('handler', 'children')
+
+    def __init__(self, handler):
+        self.handler = handler
+        if isinstance(handler, NestedHandler):
+            self.children = {name: Route(h) for name, h in handler.for_path.items()}
+        else:
+            self.children = None
 
 class Registry:
     def __init__(self, name=""):
         self.for_path = dict()
+        self.routes = dict()
 
         self.for_type = dict()
         self.service = None
@@ -893,6 +1962,7 @@ class Registry:
             raise Exception('dupe')
         self.for_path[n] = handler
         self.for_type[obj] = handler
+        self.routes[n] = Route(handler)
 
         for cls in handler.subtypes():
             if cls in self.for_type:
@@ -919,36 +1989,154 @@ class Registry:
             )
         return self.service
 
+    def route(self, path):
+        """ walks the route trie in one pass, returning the innermost
+        handler for the path, the context of objects bound on the way
+        there, and the rest of the path, from the handler's name on """
+        head, _, rest = path.partition('/')
+        route = self.routes.get(head.split('.',1)[0])
+        if route is None:
+            raise dom.NotFound(path)
+        context = {}
+        url = path
+        while route.children is not None:
+            name, _, tail = rest.partition('/')
+            child = route.children.get(name)
+            if child is None:
+                break
+            route.handler.bind(context)
+            route, url, rest = child, rest, tail
+        return route.handler, context, url
+
     def handle(self, request):
+        token = concurrent_requests.set(request.environ.get('wsgi.multithread', True))
+        try:
+            out, path, codec = self.dispatch(request)
+            if inspect.isawaitable(out):
+                # an async def was called, with no event loop to run it on
+                out = asyncio.run(resolve(out))
+            return self.respond(out, path, codec, request)
+        finally:
+            concurrent_requests.reset(token)
+
+    async def handle_async(self, request, executor=None):
+        """ like handle, but sync code runs on the executor, and async
+        functions and methods are awaited on the running loop """
+        loop = asyncio.get_running_loop()
+        out, path, codec = await loop.run_in_executor(executor, self.dispatch, request)
+        out = await resolve(out)
+        return await loop.run_in_executor(executor, self.respond, out, path, codec, request)
+
+    def dispatch(self, request):
+        """ returns the object the request is for, the path, and the codec
+        to send it with. out is awaitable if an async def was called """
         path = request.path[:]
+        codec = dom.codec_for(request.accept_mimetypes.best_match(
+            [dom.CONTENT_TYPE, dom.BINARY_CONTENT_TYPE]))
         if path == self.prefix or path == self.prefix[:-1]:
             out = self.index()
         elif path:
             p = len(self.prefix)
             path = path[p:]
-            name = path.split('/',1)[0].split('.',1)[0]
-            if name in self.for_path:
-                data  = request.data.decode('utf-8')
-                if data:
-                    args = dom.parse(data)
-                else:
-                    args = None
+            if path == '_batch':
+                if request.method != 'POST':
+                    raise dom.MethodNotAllowed()
+                data = request.get_data()
+                requests = dom.codec_for(request.content_type).parse_bytes(data) if data else None
+                return self.dispatch_batch(requests), path, codec
+
+            handler, context, url = self.route(path)
+            data = request.get_data()
+            if data:
+                args = dom.codec_for(request.content_type).parse_bytes(data)
+            else:
+                args = None
 
-                params = request.args
+            params = request.args
 
-                context = {}
-                request = dom.Request(
-                    method=request.method,
-                    url=path,
-                    params=params, 
-                    headers={},
-                    data=args,
-                )
+            request = dom.Request(
+                method=request.method,
+                url=url,
+                params=params, 
+                headers={},
+                data=args,
+            )
 
-                out = self.for_path[name].on_request(context, request)
-            else:
-                raise dom.NotFound(path)
-        
+            out = handler.on_request(context, request)
+        return out, path, codec
+
+    def dispatch_batch(self, requests):
+        """ dispatches a list of dom.Requests, posted to _batch, returning
+        a dom.Response for each. an error in one request is sent back as
+        its response, and does not stop the others. out is awaitable if
+        any async def was called """
+        if not isinstance(requests, list):
+            raise BadRequest('expected a list of requests')
+        responses = []
+        waiting = False
+        for request in requests:
+            try:
+                out, path = self.batch_request(request)
+                if inspect.isawaitable(out):
+                    responses.append((out, path))
+                    waiting = True
+                else:
+                    responses.append(self.batch_response(out, path))
+            except (StopIteration, GeneratorExit, SystemExit, KeyboardInterrupt):
+                raise
+            except Exception as e:
+                responses.append(self.batch_error(e))
+        if waiting:
+            return self.resolve_batch(responses)
+        return responses
+
+    async def resolve_batch(self, responses):
+        for n, response in enumerate(responses):
+            if isinstance(response, tuple):
+                out, path = response
+                try:
+                    responses[n] = self.batch_response(await resolve(out), path)
+                except Exception as e:
+                    responses[n] = self.batch_error(e)
+        return responses
+
+    def batch_request(self, request):
+        """ the object a request in a batch is for, and its path """
+        if not isinstance(request, dom.Request):
+            raise BadRequest('expected a request')
+        path = request.url
+        if not path.startswith(self.prefix):
+            raise dom.NotFound(path)
+        path = path[len(self.prefix):]
+        handler, context, url = self.route(path)
+        request = dom.Request(
+            method=request.method,
+            url=url,
+            params=request.params or {},
+            headers={},
+            data=request.data,
+        )
+        return handler.on_request(context, request), path
+
+    def batch_response(self, out, path):
+        if isinstance(out, Embed):
+            if getattr(out, 'stream', False):
+                raise BadRequest("streams can't be batched")
+            out = out.embed(self.prefix, path)
+        if out is None:
+            return dom.Response(204, 'No Content', {}, None)
+        return dom.Response(200, 'OK', {}, out)
+
+    def batch_error(self, exception):
+        if isinstance(exception, HTTPException):
+            return dom.Response(exception.code, exception.name, {}, exception.description)
+        print(traceback.format_exc(), file=sys.stderr)
+        return dom.Response(500, 'Internal Server Error', {}, str(exception))
+
+    def respond(self, out, path, codec, request=None):
+        """ the response for out. a GET gets an ETag, from the version of
+        out if it has one, or else a hash of the body, if it fits in one
+        chunk. a GET with a matching If-None-Match gets a 304 instead """
         def transform(o):
             if isinstance(o, type) or isinstance(o, types.FunctionType):
                 return self.for_type[o].embed(self.prefix, o)
@@ -956,6 +2144,8 @@ class Registry:
                 return self.for_type[o.__self__].embed(self.prefix, o)
             elif o.__class__ in self.for_type:
                 return self.for_type[o.__class__].embed(self.prefix, o)
+            elif o.__class__ is Projection:
+                return self.for_type[o.obj.__class__].embed(self.prefix, o)
             elif isinstance(o, Embed):
                 return o.embed(self.prefix, path)
             return o
@@ -963,19 +2153,61 @@ class Registry:
         if out is None:
             return Response('', status='204 None')
 
-        result = dom.dump(out, transform)
-        return Response(result, content_type=dom.CONTENT_TYPE) 
-    def app(self):
-        return WSGIApp(self.handle)
+        stream = getattr(out, 'stream', False)
+        etag = None
+        if request is not None and request.method == 'GET' and not stream:
+            version = version_of(out)
+            if version is not None:
+                etag = make_etag(codec.content_type, request.full_path, repr(version))
+                if request.if_none_match.contains_weak(etag):
+                    return not_modified(etag)
+        else:
+            request = None
+
+        chunks = codec.dump_iter(out, transform)
+        if stream:
+            return Response(chunks, content_type=codec.content_type)
+
+        # encode the first two chunks up front: small responses are sent
+        # whole, and errors in larger ones are still caught early on
+        first = next(chunks, '')
+        second = next(chunks, None)
+        if second is None:
+            if request is not None and etag is None:
+                etag = make_etag(codec.content_type, first)
+            response = Response(first, content_type=codec.content_type)
+        else:
+            result = itertools.chain((first, second), chunks)
+            response = Response(result, content_type=codec.content_type)
+
+        if etag is not None:
+            if request.if_none_match.contains_weak(etag):
+                return not_modified(etag)
+            response.set_etag(etag, weak=True)
+        return response
+
+    def app(self, compress_min_size=COMPRESS_MIN_SIZE, max_body_size=MAX_BODY_SIZE):
+        return WSGIApp(self.handle, compress_min_size, max_body_size)
+
+    def asgi_app(self, compress_min_size=COMPRESS_MIN_SIZE, workers=64, max_body_size=MAX_BODY_SIZE):
+        return ASGIApp(self.handle_async, compress_min_size, workers, max_body_size)
 
 class WSGIApp:
-    def __init__(self, handler):
+    """ compress_min_size is the smallest response body worth compressing,
+    for clients that send Accept-Encoding. None turns compression off.
+    compressed request bodies that expand past max_body_size get a 413 """
+    def __init__(self, handler, compress_min_size=COMPRESS_MIN_SIZE, max_body_size=MAX_BODY_SIZE):
         self.handler = handler
+        self.compress_min_size = compress_min_size
+        self.max_body_size = max_body_size
 
     def __call__(self, environ, start_response):
-        request = Request(environ)
         try:
+            self.decompress_body(environ)
+            request = Request(environ)
             response = self.handler(request)
+            if self.compress_min_size is not None:
+                response = self.compress(request, response)
         except (StopIteration, GeneratorExit, SystemExit, KeyboardInterrupt):
             raise
         except HTTPException as r:
@@ -987,12 +2219,161 @@ class WSGIApp:
             response = self.error_response(e, trace)
         return response(environ, start_response)
 
+    def decompress_body(self, environ):
+        encoding = environ.get('HTTP_CONTENT_ENCODING', 'identity').lower()
+        if encoding == 'identity':
+            return
+        if encoding not in compressions:
+            raise BadRequest('unsupported Content-Encoding: {}'.format(encoding))
+        length = int(environ.get('CONTENT_LENGTH') or 0)
+        data = environ['wsgi.input'].read(length)
+        decompressor = zlib.decompressobj(compressions[encoding])
+        try:
+            data = decompressor.decompress(data, self.max_body_size)
+        except zlib.error as e:
+            raise BadRequest('bad {} request body: {}'.format(encoding, e))
+        if decompressor.unconsumed_tail:
+            raise RequestEntityTooLarge('request body expands past {} bytes'.format(self.max_body_size))
+        if not decompressor.eof:
+            raise BadRequest('bad {} request body: truncated'.format(encoding))
+        environ['wsgi.input'] = io.BytesIO(data)
+        environ['CONTENT_LENGTH'] = str(len(data))
+        del environ['HTTP_CONTENT_ENCODING']
+
+    def compress(self, request, response):
+        if response.status_code == 204 or 'Content-Encoding' in response.headers:
+            return response
+        encoding = request.accept_encodings.best_match(list(compressions))
+        if encoding is None:
+            return response
+
+        compressor = zlib.compressobj(6, zlib.DEFLATED, compressions[encoding])
+        if not response.is_streamed:
+            data = response.get_data()
+            if len(data) < self.compress_min_size:
+                return response
+            response.set_data(compressor.compress(data) + compressor.flush())
+        else:
+            # streamed bodies are big, or sent as they are made (a watch),
+            # so each chunk is flushed rather than held back
+            chunks = response.iter_encoded()
+            def compressed():
+                for chunk in chunks:
+                    yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+                yield compressor.flush()
+            response.response = compressed()
+            response.headers.pop('Content-Length', None)
+        response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        return response
+
     def log_error(self, exception, trace):
         print(trace, file=sys.stderr)
 
     def error_response(self, exception, trace):
         return Response(trace, status='500 not ok (%s)'%exception)
 
+class ASGIApp(WSGIApp):
+    """ an asgi app, for when handlers are async. sync handlers and the
+    encoding of responses run on a pool of `workers` threads """
+    def __init__(self, handler, compress_min_size=COMPRESS_MIN_SIZE, workers=64, max_body_size=MAX_BODY_SIZE):
+        WSGIApp.__init__(self, handler, compress_min_size, max_body_size)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='catbus')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise ValueError('unsupported scope: {}'.format(scope['type']))
+
+        body = []
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body.append(message.get('body', b''))
+            if not message.get('more_body', False):
+                break
+        environ = self.environ(scope, b''.join(body))
+
+        loop = asyncio.get_running_loop()
+        try:
+            self.decompress_body(environ)
+            request = Request(environ)
+            response = await self.handler(request, self.executor)
+            if self.compress_min_size is not None:
+                response = await loop.run_in_executor(self.executor, self.compress, request, response)
+        except (StopIteration, GeneratorExit, SystemExit, KeyboardInterrupt):
+            raise
+        except HTTPException as r:
+            response = r.get_response(environ)
+            self.log_error(r, traceback.format_exc())
+        except Exception as e:
+            trace = traceback.format_exc()
+            self.log_error(e, trace)
+            response = self.error_response(e, trace)
+
+        app_iter, status, headers = response.get_wsgi_response(environ)
+        try:
+            await send({
+                'type': 'http.response.start',
+                'status': int(status.split(' ', 1)[0]),
+                'headers': [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers],
+            })
+            chunks = iter(app_iter)
+            while True:
+                chunk = await loop.run_in_executor(self.executor, next, chunks, None)
+                if chunk is None:
+                    break
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def environ(self, scope, body):
+        """ the wsgi environ for an asgi http scope """
+        server = scope.get('server') or ('localhost', 80)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+            'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': 'HTTP/{}'.format(scope.get('http_version', '1.1')),
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for name, value in scope.get('headers', ()):
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if name == 'CONTENT_LENGTH':
+                continue
+            if name != 'CONTENT_TYPE':
+                name = 'HTTP_' + name
+            if name in environ:
+                value = environ[name] + ',' + value
+            environ[name] = value
+        return environ
+
 class QuietWSGIRequestHandler(WSGIRequestHandler):
     def log_request(self, code='-', size='-'):
         pass
@@ -1026,3 +2407,136 @@ class Server(threading.Thread):
                 import traceback
                 traceback.print_exc()
         self.join(5)
+
+class KeepAliveServerHandler(ServerHandler):
+    """ a ServerHandler that answers in HTTP/1.1, so that the connection
+    can be reused, sending bodies without a Content-Length as chunks """
+    http_version = "1.1"
+    chunked = False
+    in_body = False
+
+    def cleanup_headers(self):
+        ServerHandler.cleanup_headers(self)
+        if 'Content-Length' in self.headers or self.status[:3] in ('204', '304'):
+            return
+        if self.request_handler.request_version == 'HTTP/1.1' and self.environ['REQUEST_METHOD'] != 'HEAD':
+            self.headers['Transfer-Encoding'] = 'chunked'
+            self.chunked = True
+        else:
+            # no length, so the body ends when the connection does
+            self.headers['Connection'] = 'close'
+            self.request_handler.close_connection = True
+
+    def send_headers(self):
+        ServerHandler.send_headers(self)
+        self.in_body = self.chunked
+
+    def _write(self, data):
+        if self.in_body:
+            if not data:
+                return
+            data = b'%x\r\n' % len(data) + data + b'\r\n'
+        ServerHandler._write(self, data)
+
+    def finish_content(self):
+        ServerHandler.finish_content(self)
+        if self.in_body:
+            self.in_body = False
+            ServerHandler._write(self, b'0\r\n\r\n')
+
+class KeepAliveRequestHandler(WSGIRequestHandler):
+    """ handles requests on a connection until the client closes it,
+    or leaves it idle for more than timeout seconds """
+    protocol_version = "HTTP/1.1"
+    timeout = 5
+
+    def handle(self):
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection:
+            self.handle_one_request()
+
+    def handle_one_request(self):
+        self.close_connection = True
+        try:
+            self.raw_requestline = self.rfile.readline(65537)
+        except (socket.timeout, ConnectionError):
+            return
+        if not self.raw_requestline:
+            return
+        if len(self.raw_requestline) > 65536:
+            self.requestline = ''
+            self.request_version = ''
+            self.command = ''
+            self.send_error(414)
+            return
+
+        if not self.parse_request(): # An error code has been sent, just exit
+            return
+        if 'chunked' in self.headers.get('Transfer-Encoding', '').lower():
+            self.close_connection = True
+
+        # what the app does not read of the body is skipped afterwards,
+        # so the next request starts in the right place
+        environ = self.get_environ()
+        body = LimitedStream(self.rfile, int(environ.get('CONTENT_LENGTH') or 0))
+        handler = KeepAliveServerHandler(
+            body, self.wfile, self.get_stderr(), environ,
+            multithread=True,
+        )
+        handler.request_handler = self      # backpointer for logging
+        handler.run(self.server.get_app())
+        if not self.close_connection:
+            body.exhaust()
+
+class QuietKeepAliveRequestHandler(KeepAliveRequestHandler):
+    def log_request(self, code='-', size='-'):
+        pass
+
+class PooledWSGIServer(WSGIServer):
+    """ a WSGIServer that hands each connection to a bounded pool of
+    worker threads, and `backlog` more can wait to be accepted """
+    def __init__(self, server_address, request_handler, workers, backlog):
+        self.request_queue_size = backlog
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='catbus')
+        self.connections = set()
+        WSGIServer.__init__(self, server_address, request_handler)
+
+    def process_request(self, request, client_address):
+        self.connections.add(request)
+        self.pool.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.connections.discard(request)
+            self.shutdown_request(request)
+
+    def server_close(self):
+        WSGIServer.server_close(self)
+        # wake up the workers waiting on idle connections
+        for request in list(self.connections):
+            try:
+                request.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self.pool.shutdown(wait=False)
+
+class PooledServer(Server):
+    """ like Server, but handling up to `workers` connections at once,
+    with HTTP/1.1 keep-alive """
+    def __init__(self, app, host="", port=0, request_handler=QuietKeepAliveRequestHandler,
+            workers=64, backlog=128, keepalive_seconds=5):
+        threading.Thread.__init__(self)
+        self.daemon=True
+        self.running = True
+        handler = type(request_handler.__name__, (request_handler,), {'timeout': keepalive_seconds})
+        self.server = PooledWSGIServer((host, port), handler, workers, backlog)
+        self.server.set_app(app)
+
+    def stop(self):
+        Server.stop(self)
+        self.server.server_close()
@@ -1,6 +1,7 @@
 from catbus import client, server
 
 import sys
+import requests
 import collections
 import uuid
 from datetime import datetime, timezone
@@ -25,9 +26,17 @@ class Person(Model):
     def hello(self):
         return "Hello, {}!".format(self.name)
 
+@registry.add()
+class Tag(Model):
+    class Meta: database = db
+
+    label = CharField()
+
+    Handler = server.Model.PeeweeHandler
+
 def test():
     db.connect()
-    db.create_tables([Person], safe=True)
+    db.create_tables([Person, Tag], safe=True)
 
     server_thread = server.Server(registry.app(), port=8888)
     server_thread.start()
@@ -42,7 +51,7 @@ def test():
 
 def run():
     db.connect()
-    db.create_tables([Person], safe=True)
+    db.create_tables([Person, Tag], safe=True)
 
     server_thread = server.Server(registry.app(), port=8888)
     server_thread.start()
@@ -104,6 +113,29 @@ def test_client(url):
     for person in people:
         client.Delete(person)
     print('Deleted')
+    print()
+
+    print('Missing...')
+    missing = str(uuid.uuid4())
+    for verb, fetch in (('GET', lambda: client.Get(s.Person, key=missing)),
+                        ('PATCH', lambda: client.Update(s.Person, key=missing, value=dict(job='baz')))):
+        try:
+            fetch()
+        except requests.HTTPError as e:
+            print(" ", verb, e.response.status_code)
+            assert e.response.status_code == 404
+        else:
+            raise AssertionError('found a missing person')
+    print()
+
+    print('Creating Many...')
+    changes = registry.for_type[Tag].changes
+    start = changes.position(None) # as a watch does, so the changes are kept
+    count = client.CreateMany(s.Tag, [dict(label=label) for label in ('red', 'green', 'blue')])
+    keys = [key for n, event, key, obj in changes.follow(start, 0)]
+    print(" Created", count, "with keys", keys)
+    assert count == 3 and None not in keys
+    client.DeleteMany(s.Tag, keys)
 
     	
     print('Listing All...')
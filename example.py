@@ -1,6 +1,8 @@
 from catbus import client, server
 
 import sys
+import time
+import threading
 from datetime import datetime, timezone
 
 def make_server():
@@ -68,6 +70,16 @@ def make_server():
         def total(self):
             return self.sum
 
+        @server.waiter()
+        def reaches(self, n):
+            return server.Waiter(n=n)
+
+        @reaches.ready()
+        def reaches(self, n):
+            if self.sum < n:
+                return server.Waiter(n=n)
+            return self.sum
+
    # A collection of instances
 
     jobs = {}
@@ -159,6 +171,10 @@ def test():
         client.Call(total.add(5))
         client.Call(total.add(5))
 
+        with client.Batch(client.client, s) as batch:
+            sums = [batch.Call(total.add(n)) for n in range(3)]
+        print([f.result() for f in sums])
+
         print(client.Call(total.total()))
 
 
@@ -169,6 +185,16 @@ def test():
 
         for j in client.List(s.Job):
             print(j)
+
+        for p in client.List(s.Job, fields=["state"]):
+            if list(p.attributes) != ["state"]:
+                raise AssertionError('fields not projected')
+        try:
+            list(client.List(s.Job, fields=["nope"]))
+        except Exception as error:
+            print(error)
+        else:
+            raise AssertionError('unknown field accepted')
     
         waiter = client.Call(j.wait())
         print(waiter)
@@ -184,6 +210,23 @@ def test():
         exp = client.Wait(exp, poll_seconds=0.5)
         
         print(exp)
+
+        # Server handles one request at a time, so it doesn't long poll,
+        # and a waiter doesn't hold up the call it is waiting on
+        target = client.Call(total.total()) + 1
+        waiter = client.Call(total.reaches(target))
+        if 'long_poll_seconds' in waiter.metadata:
+            raise AssertionError('long poll offered by a single threaded server')
+        result = []
+        poll = threading.Thread(target=lambda: result.append(client.Wait(waiter, poll_seconds=0.1)))
+        poll.start()
+        time.sleep(0.2)
+        start = time.monotonic()
+        client.Call(total.add(1))
+        if time.monotonic() - start > 1:
+            raise AssertionError('call held up by a waiter')
+        poll.join()
+        print(result)
     finally:
         server_thread.stop()
 